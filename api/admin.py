@@ -2,10 +2,14 @@ from django.contrib import admin
 from .models import *
 # Register your models here.
 admin.site.register(Address)
-admin.site.register(Product)
+class ProductAdmin(admin.ModelAdmin):
+    readonly_fields = ('version',)  # bumped by Product.save()
+
+admin.site.register(Product, ProductAdmin)
 admin.site.register(ProductImage)
 admin.site.register(Cart)
 admin.site.register(CartItem)
 admin.site.register(Order)
 admin.site.register(AdminOrder)
-admin.site.register(UserProfile)
\ No newline at end of file
+admin.site.register(UserProfile)
+admin.site.register(CurrencyRate)
\ No newline at end of file
@@ -0,0 +1,192 @@
+# analytics.py
+#
+# Daily sales rollups (DailyProductSales, DailyStatusSales).
+#
+# Incremental: signals.py calls the record_* functions whenever an order is
+# created, changed, deleted or gets products added/removed. They add deltas
+# with a single INSERT ... ON CONFLICT DO UPDATE per event.
+#
+# Full rebuild: rebuild() scans Order with the Order.products through table,
+# then ArchivedOrder, in primary-key chunks and aggregates every chunk with NumPy (plain Python when
+# NumPy is not installed), then rewrites both rollup tables in one transaction.
+#
+# Product revenue is the product's price when the order is rolled up; orders
+# carry no per-line prices, so a rebuild uses today's prices.
+
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import date
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Max, Min
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .db import add_counts
+from .models import ArchivedOrder, DailyProductSales, DailyStatusSales, Order, Product
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, rebuild() falls back to plain Python
+    np = None
+
+CENT = Decimal('0.01')
+STATUS_SPAN = 64  # room for status codes when packing (day, status) into one int
+
+_paused = ContextVar('rollups_paused', default=False)
+
+
+@contextmanager
+def rollups_paused():
+    # Order writes inside this block are not reflected in the rollups, e.g.
+    # when archiving moves orders out of Order without them leaving the books.
+    token = _paused.set(True)
+    try:
+        yield
+    finally:
+        _paused.reset(token)
+
+
+def is_paused():
+    return _paused.get()
+
+
+def order_day(order):
+    return timezone.localdate(order.created_at)
+
+
+def record_order(order, sign=1, before=None):
+    # `before` is (status, total_price, created_at) of the saved row when an
+    # existing order is updated; its contribution is taken back out first.
+    deltas = defaultdict(lambda: [0, Decimal(0)])
+    if before is not None:
+        status, total_price, created_at = before
+        key = (timezone.localdate(created_at), status)
+        deltas[key][0] -= 1
+        deltas[key][1] -= Decimal(total_price)
+    key = (order_day(order), order.status)
+    deltas[key][0] += sign
+    deltas[key][1] += sign * Decimal(order.total_price)
+    add_counts(DailyStatusSales, ('day', 'status'), ('orders', 'revenue'),
+               {key: tuple(values) for key, values in deltas.items() if values != [0, 0]})
+
+
+def record_order_products(pairs, sign=1):
+    # `pairs` are (order_id, product_id) rows added to (sign=1) or removed
+    # from (sign=-1) Order.products.
+    if not pairs:
+        return
+    days = {
+        pk: timezone.localdate(created_at)
+        for pk, created_at in Order.objects.filter(pk__in={order_id for order_id, _ in pairs}).values_list('pk', 'created_at')
+    }
+    prices = dict(Product.objects.filter(pk__in={product_id for _, product_id in pairs}).values_list('pk', 'price'))
+    deltas = defaultdict(lambda: [0, Decimal(0)])
+    for order_id, product_id in pairs:
+        if order_id in days and product_id in prices:
+            key = (days[order_id], product_id)
+            deltas[key][0] += sign
+            deltas[key][1] += sign * prices[product_id]
+    add_counts(DailyProductSales, ('day', 'product'), ('units', 'revenue'),
+               {key: tuple(values) for key, values in deltas.items()})
+
+
+def _sum_by_key(keys, amounts):
+    # [(key, count, total)] for integer keys/amounts, grouped by key.
+    if np is not None:
+        unique, inverse = np.unique(np.asarray(keys, dtype=np.int64), return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(unique))
+        totals = np.bincount(inverse, weights=np.asarray(amounts, dtype=np.float64), minlength=len(unique))
+        return zip(unique.tolist(), counts.tolist(), np.rint(totals).astype(np.int64).tolist())
+    grouped = defaultdict(lambda: [0, 0])
+    for key, amount in zip(keys, amounts):
+        grouped[key][0] += 1
+        grouped[key][1] += amount
+    return ((key, count, total) for key, (count, total) in grouped.items())
+
+
+def _cents(value):
+    return int(Decimal(value).quantize(CENT) * 100)
+
+
+def _order_chunks(chunk_size):
+    # Yields ([(pk, day, status, total_price)], [(order_id, product_id)]) per
+    # primary-key window, first for live orders, then for archived ones.
+    through = Order.products.through
+    for model in (Order, ArchivedOrder):
+        bounds = model.objects.aggregate(low=Min('pk'), high=Max('pk'))
+        if bounds['low'] is None:
+            continue
+        for start in range(bounds['low'], bounds['high'] + 1, chunk_size):
+            window = model.objects.filter(pk__gte=start, pk__lt=start + chunk_size).annotate(day=TruncDate('created_at'))
+            if model is Order:
+                orders = list(window.values_list('pk', 'day', 'status', 'total_price'))
+                pairs = through.objects.filter(order_id__gte=start, order_id__lt=start + chunk_size)
+                pairs = list(pairs.values_list('order_id', 'product_id'))
+            else:
+                rows = list(window.values_list('pk', 'day', 'status', 'total_price', 'product_ids'))
+                orders = [row[:4] for row in rows]
+                pairs = [(row[0], product_id) for row in rows for product_id in row[4]]
+            if orders:
+                yield orders, pairs
+
+
+def rebuild(chunk_size=10000):
+    # Recomputes both rollup tables from Order / Order.products and
+    # ArchivedOrder. Returns the
+    # number of (status rows, product rows) written.
+    statuses = [value for value, _ in Order.STATUS_CHOICES]
+    status_codes = {value: code for code, value in enumerate(statuses)}
+    product_prices = {pk: _cents(price) for pk, price in Product.objects.values_list('pk', 'price')}
+    product_span = max(product_prices, default=0) + 1
+
+    status_totals = defaultdict(lambda: [0, 0])
+    product_totals = defaultdict(lambda: [0, 0])
+    for orders, pairs in _order_chunks(chunk_size):
+        order_days = {}
+        keys, amounts = [], []
+        for pk, day, status, total_price in orders:
+            ordinal = day.toordinal()
+            order_days[pk] = ordinal
+            code = status_codes.get(status)
+            if code is None:
+                code = status_codes[status] = len(statuses)
+                statuses.append(status)
+            keys.append(ordinal * STATUS_SPAN + code)
+            amounts.append(_cents(total_price))
+        for key, count, total in _sum_by_key(keys, amounts):
+            totals = status_totals[divmod(key, STATUS_SPAN)]
+            totals[0] += count
+            totals[1] += total
+
+        keys, amounts = [], []
+        for order_id, product_id in pairs:
+            if order_id not in order_days or product_id not in product_prices:
+                continue  # created while the rebuild was running
+            keys.append(order_days[order_id] * product_span + product_id)
+            amounts.append(product_prices[product_id])
+        for key, count, total in _sum_by_key(keys, amounts):
+            totals = product_totals[divmod(key, product_span)]
+            totals[0] += count
+            totals[1] += total
+
+    with transaction.atomic():
+        DailyStatusSales.objects.all().delete()
+        DailyProductSales.objects.all().delete()
+        DailyStatusSales.objects.bulk_create(
+            (
+                DailyStatusSales(day=date.fromordinal(ordinal), status=statuses[code], orders=count, revenue=Decimal(cents) / 100)
+                for (ordinal, code), (count, cents) in status_totals.items()
+            ),
+            batch_size=1000,
+        )
+        DailyProductSales.objects.bulk_create(
+            (
+                DailyProductSales(day=date.fromordinal(ordinal), product_id=product_id, units=count, revenue=Decimal(cents) / 100)
+                for (ordinal, product_id), (count, cents) in product_totals.items()
+            ),
+            batch_size=1000,
+        )
+    return len(status_totals), len(product_totals)
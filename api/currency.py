@@ -0,0 +1,83 @@
+# currency.py
+#
+# Prices are stored in settings.BASE_CURRENCY. Responses can show them in
+# another currency, picked with ?currency=XXX or an Accept-Currency header.
+#
+# The rate table (CurrencyRate, edited in the admin or loaded from a file with
+# manage.py load_currency_rates) is kept in process memory together with the
+# version it was loaded at: the newest updated_at and the row count of the
+# table. Every converting request reads the version (one aggregate query), so
+# a rate written by any process, including deletes and bulk loads, is picked
+# up by all of them on their next request. Each Currency carries its rounding
+# precomputed, so converting is a multiply and a quantize.
+
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils.cache import patch_vary_headers
+from rest_framework.exceptions import NotAcceptable
+
+from .models import CurrencyRate
+
+HEADER = 'HTTP_ACCEPT_CURRENCY'
+
+_table = (None, {})  # ((newest updated_at, row count), {code: Currency})
+
+
+class Currency:
+    __slots__ = ('code', 'rate', 'quantum', 'format')
+
+    def __init__(self, code, rate, decimal_places):
+        self.code = code
+        self.rate = rate
+        self.quantum = Decimal(1).scaleb(-decimal_places)
+        self.format = '{:.%df}' % decimal_places
+
+    def convert(self, amount):
+        # Decimal in the base currency -> Decimal in this one, rounded half up.
+        if amount is None:
+            return None
+        return (Decimal(amount) * self.rate).quantize(self.quantum, ROUND_HALF_UP)
+
+    def to_string(self, amount):
+        # Same as convert(), formatted like serializers.DecimalField output.
+        if amount is None:
+            return None
+        return self.format.format(self.convert(amount))
+
+
+def version():
+    stamp = CurrencyRate.objects.aggregate(changed=Max('updated_at'), count=Count('pk'))
+    return stamp['changed'], stamp['count']
+
+
+def rates():
+    # {code: Currency} for every configured currency, reloaded when the
+    # table's version changes.
+    global _table
+    current = version()
+    if _table[0] != current:
+        _table = (current, {
+            code: Currency(code, rate, places)
+            for code, rate, places in CurrencyRate.objects.values_list('code', 'rate', 'decimal_places')
+        })
+    return _table[1]
+
+
+def from_request(request):
+    # The Currency a request asked for, or None for the base currency.
+    code = request.query_params.get('currency') or request.META.get(HEADER)
+    if not code or code.strip().upper() == settings.BASE_CURRENCY:
+        return None
+    currency = rates().get(code.strip().upper())
+    if currency is None:
+        raise NotAcceptable(f"Unsupported currency: {code}.")
+    return currency
+
+
+def tag(response, currency):
+    # Says which currency the amounts are in; the body depends on the header.
+    response['Content-Currency'] = currency.code if currency else settings.BASE_CURRENCY
+    patch_vary_headers(response, ('Accept-Currency',))
+    return response
@@ -0,0 +1,36 @@
+# db.py
+
+from django.db import connections, router
+
+
+def add_counts(model, key_fields, value_fields, deltas):
+    # Adds {key_tuple: value_tuple} deltas to counter rows of `model` in one
+    # INSERT ... ON CONFLICT (key_fields) DO UPDATE SET v = v + excluded.v.
+    # key_fields must be covered by a unique constraint.
+    if not deltas:
+        return
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    fields = [model._meta.get_field(name) for name in key_fields + value_fields]
+    table = quote(model._meta.db_table)
+    columns = ", ".join(quote(field.column) for field in fields)
+    conflict = ", ".join(quote(field.column) for field in fields[:len(key_fields)])
+    updates = ", ".join(
+        f"{quote(field.column)} = {table}.{quote(field.column)} + excluded.{quote(field.column)}"
+        for field in fields[len(key_fields):]
+    )
+    row = "(" + ", ".join(["%s"] * len(fields)) + ")"
+    # Stay well under SQLite's bound-parameter limit
+    batch_size = max(1, 900 // len(fields))
+    items = list(deltas.items())
+    with connection.cursor() as cursor:
+        for start in range(0, len(items), batch_size):
+            batch = items[start:start + batch_size]
+            params = []
+            for key, values in batch:
+                params += [field.get_db_prep_save(value, connection) for field, value in zip(fields, key + values)]
+            cursor.execute(
+                f"INSERT INTO {table} ({columns}) VALUES {', '.join([row] * len(batch))} "
+                f"ON CONFLICT ({conflict}) DO UPDATE SET {updates}",
+                params,
+            )
@@ -0,0 +1,133 @@
+# guest_cart.py
+#
+# Carts for anonymous shoppers. A guest cart is identified by a random key that
+# the client holds as a signed token (X-Guest-Cart header). Its contents are a
+# plain {product_id: quantity} dict stored in the GuestCart table, which every
+# worker reads and writes directly. Writes are conditional on the version that
+# was read, so two requests changing the same cart at once cannot overwrite
+# each other: the loser re-reads the cart and applies its change again.
+
+import uuid
+from collections.abc import Mapping
+
+from django.core import signing
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .models import Cart, CartItem, GuestCart, Product
+
+SALT = 'api.guest-cart'
+HEADER = 'HTTP_X_GUEST_CART'
+ATTEMPTS = 5
+
+
+class Conflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "The guest cart is being changed by another request. Try again."
+
+
+def new_token():
+    key = uuid.uuid4().hex
+    return key, signing.Signer(salt=SALT).sign(key)
+
+
+def key_from_token(token):
+    try:
+        return signing.Signer(salt=SALT).unsign(token)
+    except signing.BadSignature:
+        return None
+
+
+def key_from_request(request):
+    token = request.META.get(HEADER)
+    if not token and isinstance(request.data, Mapping):  # a JSON body may be a list
+        token = request.data.get('guest_cart')
+    return key_from_token(token) if isinstance(token, str) and token else None
+
+
+def load(key):
+    # (items, version); version is 0 for a cart that was never saved.
+    stored = GuestCart.objects.filter(key=key).values_list('items', 'version').first()
+    if stored is None:
+        return {}, 0
+    return {int(product_id): quantity for product_id, quantity in stored[0].items()}, stored[1]
+
+
+def save(key, items, version):
+    # Stores items if the cart is still at the version it was loaded at.
+    # Returns False when another request saved it in between.
+    if version == 0:
+        try:
+            with transaction.atomic():
+                GuestCart.objects.create(key=key, items=items)
+        except IntegrityError:
+            return False
+        return True
+    updated = GuestCart.objects.filter(key=key, version=version).update(
+        items=items, version=F('version') + 1, updated_at=timezone.now(),
+    )
+    return updated == 1
+
+
+def change(key, apply):
+    # Loads the cart, calls apply(items) to change it in place and saves it,
+    # starting over from a fresh copy when another request saved the cart
+    # meanwhile. apply returns False to leave the cart alone. Returns the saved
+    # items, or None when apply declined.
+    for _ in range(ATTEMPTS):
+        items, version = load(key)
+        if apply(items) is False:
+            return None
+        if save(key, items, version):
+            return items
+    raise Conflict()
+
+
+def detail(key, items, currency=None):
+    # Same shape as CartDetailView's response, plus the cart token. Amounts are
+    # converted when a currency.Currency is given.
+    convert = currency.convert if currency else (lambda amount: amount)
+    found = {pk: (name, price) for pk, name, price in Product.objects.filter(pk__in=items).values_list('pk', 'name', 'price')}
+    products = [
+        {
+            'product_id': product_id,
+            'name': found[product_id][0],
+            'price': found[product_id][1],
+            'quantity': quantity,
+            'subtotal': found[product_id][1] * quantity,
+        }
+        for product_id, quantity in items.items() if product_id in found
+    ]
+    total_price = sum((product['subtotal'] for product in products), 0)
+    for product in products:
+        product['price'], product['subtotal'] = convert(product['price']), convert(product['subtotal'])
+    return {
+        'token': signing.Signer(salt=SALT).sign(key),
+        'total_price': convert(total_price),
+        'total_count': sum(product['quantity'] for product in products),
+        'products': products,
+    }
+
+
+def merge_into_cart(user, key):
+    # Folds the guest cart into the user's Cart with a single bulk upsert
+    # (quantities are added up) and drops the guest cart, in one transaction.
+    # The guest cart is only dropped at the version that was merged, so an
+    # item added by a concurrent request is merged too, not lost.
+    for _ in range(ATTEMPTS):
+        with transaction.atomic():
+            items, version = load(key)
+            if version and not GuestCart.objects.filter(key=key, version=version).delete()[0]:
+                continue
+            if items:
+                existing = set(Product.objects.filter(pk__in=items).values_list('pk', flat=True))
+                cart, created = Cart.objects.get_or_create(user=user)
+                CartItem.objects.upsert_many(
+                    cart.id, {product_id: quantity for product_id, quantity in items.items() if product_id in existing},
+                )
+                cart.refresh_total()
+        return
+    raise Conflict()
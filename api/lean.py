@@ -0,0 +1,194 @@
+# lean.py
+#
+# Read-only fast path for the list endpoints. These functions build the same
+# dicts as ProductSerializer / OrderSerializer / CartSerializer, but straight
+# from values_list() rows with converters compiled once per field, and with
+# nested/many-to-many data fetched in one extra query instead of one per row.
+# Render the result with renderers.FastJSONRenderer. Pass a currency.Currency
+# to have the prices converted as the serializers do with context['currency'].
+
+from collections import defaultdict
+
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from .models import Cart, CartItem, Order, Product, ProductImage
+
+
+def decimal_to_string(model, field_name):
+    # Mirrors serializers.DecimalField(coerce_to_string=True).
+    decimal_places = model._meta.get_field(field_name).decimal_places
+    fmt = '{:.%df}' % decimal_places
+
+    def convert(value):
+        if value is None:
+            return None
+        return fmt.format(value)
+    return convert
+
+
+def datetime_to_string(value):
+    # Mirrors serializers.DateTimeField() with the default ISO 8601 format.
+    if not value:
+        return None
+    value = timezone.localtime(value).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def file_to_url(request=None):
+    # Mirrors serializers.ImageField(use_url=True) for the default storage.
+    url = default_storage.url
+    if request is None:
+        return lambda name: url(name) if name else None
+    build = request.build_absolute_uri
+    return lambda name: build(url(name)) if name else None
+
+
+def compile_row(fields, converters=None):
+    # Returns a function turning a values_list() tuple for `fields` into a dict.
+    converters = converters or {}
+    steps = [(name, index, converters.get(name)) for index, name in enumerate(fields)]
+    if not any(convert for _, _, convert in steps):
+        return lambda row: dict(zip(fields, row))
+
+    def to_dict(row):
+        return {
+            name: convert(row[index]) if convert else row[index]
+            for name, index, convert in steps
+        }
+    return to_dict
+
+
+def group_pairs(queryset, key, value):
+    # {key: [value, ...]} from a two-column values_list, in queryset order.
+    grouped = defaultdict(list)
+    for k, v in queryset.values_list(key, value):
+        grouped[k].append(v)
+    return grouped
+
+
+PRODUCT_FIELDS = ('id', 'name', 'is_active', 'price', 'description', 'quantity', 'is_listed', 'version')
+ORDER_FIELDS = ('id', 'total_price', 'status', 'created_at', 'version', 'user')
+CART_FIELDS = ('id', 'total_price', 'updated_at', 'user')
+
+_product_converters = {'price': decimal_to_string(Product, 'price')}
+_order_converters = {'total_price': decimal_to_string(Order, 'total_price'), 'created_at': datetime_to_string}
+_cart_converters = {'total_price': decimal_to_string(Cart, 'total_price'), 'updated_at': datetime_to_string}
+_product_row = compile_row(PRODUCT_FIELDS, _product_converters)
+_order_row = compile_row(ORDER_FIELDS, _order_converters)
+_cart_row = compile_row(CART_FIELDS, _cart_converters)
+# ArchivedOrder rows are read as ORDER_FIELDS + product_ids and come out as orders
+_archived_order_row = compile_row(ORDER_FIELDS + ('products',), _order_converters)
+
+
+def _row_in(currency, to_dict, fields, converters, money_field):
+    # to_dict itself for the base currency, else a variant converting money_field.
+    if currency is None:
+        return to_dict
+    return compile_row(fields, {**converters, money_field: currency.to_string})
+
+
+def _products(rows, images, to_url, to_dict=_product_row):
+    for row in rows:
+        item = to_dict(row)
+        yield {
+            'id': item.pop('id'),
+            'images': [{'image': to_url(name)} for name in images.get(row[0], ())],
+            **item,
+        }
+
+
+def _with_many(rows, to_dict, many):
+    for row in rows:
+        item = to_dict(row)
+        item['products'] = many.get(row[0], [])
+        yield item
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _product_images(lookup):
+    return group_pairs(
+        ProductImage.objects.filter(**lookup).order_by('product_id', 'id'), 'product_id', 'image',
+    )
+
+
+def _order_products(lookup):
+    return group_pairs(
+        Order.products.through.objects.filter(**lookup).order_by('order_id', 'product_id'),
+        'order_id', 'product_id',
+    )
+
+
+def _cart_products(lookup):
+    return group_pairs(
+        CartItem.objects.filter(**lookup).order_by('cart_id', 'id'), 'cart_id', 'product_id',
+    )
+
+
+def serialize_products(queryset, request=None, currency=None):
+    # Same output as ProductSerializer(queryset, many=True).data; two queries.
+    images = _product_images({'product__in': queryset.values('pk')})
+    to_dict = _row_in(currency, _product_row, PRODUCT_FIELDS, _product_converters, 'price')
+    return list(_products(queryset.values_list(*PRODUCT_FIELDS), images, file_to_url(request), to_dict))
+
+
+def serialize_orders(queryset, currency=None):
+    # Same output as OrderSerializer(queryset, many=True).data; two queries.
+    products = _order_products({'order__in': queryset.values('pk')})
+    to_dict = _row_in(currency, _order_row, ORDER_FIELDS, _order_converters, 'total_price')
+    return list(_with_many(queryset.values_list(*ORDER_FIELDS), to_dict, products))
+
+
+def serialize_archived_orders(queryset, currency=None):
+    # ArchivedOrder rows shaped like OrderSerializer output; one query.
+    to_dict = _row_in(currency, _archived_order_row, ORDER_FIELDS + ('products',), _order_converters, 'total_price')
+    return [to_dict(row) for row in queryset.values_list(*ORDER_FIELDS, 'product_ids')]
+
+
+def serialize_carts(queryset, currency=None):
+    # Same output as CartSerializer(queryset, many=True).data; two queries.
+    products = _cart_products({'cart__in': queryset.values('pk')})
+    to_dict = _row_in(currency, _cart_row, CART_FIELDS, _cart_converters, 'total_price')
+    return list(_with_many(queryset.values_list(*CART_FIELDS), to_dict, products))
+
+
+# Streaming variants: rows are read with a server-side iterator and nested data
+# is fetched per chunk, so memory stays flat whatever the size of the queryset.
+# One extra query per CHUNK_SIZE rows.
+
+CHUNK_SIZE = 500
+
+
+def iter_products(queryset, request=None, chunk_size=CHUNK_SIZE, currency=None):
+    to_url = file_to_url(request)
+    to_dict = _row_in(currency, _product_row, PRODUCT_FIELDS, _product_converters, 'price')
+    rows = queryset.values_list(*PRODUCT_FIELDS).iterator(chunk_size=chunk_size)
+    for chunk in _chunks(rows, chunk_size):
+        images = _product_images({'product_id__in': [row[0] for row in chunk]})
+        yield from _products(chunk, images, to_url, to_dict)
+
+
+def iter_orders(queryset, chunk_size=CHUNK_SIZE, currency=None):
+    to_dict = _row_in(currency, _order_row, ORDER_FIELDS, _order_converters, 'total_price')
+    rows = queryset.values_list(*ORDER_FIELDS).iterator(chunk_size=chunk_size)
+    for chunk in _chunks(rows, chunk_size):
+        products = _order_products({'order_id__in': [row[0] for row in chunk]})
+        yield from _with_many(chunk, to_dict, products)
+
+
+def iter_archived_orders(queryset, chunk_size=CHUNK_SIZE, currency=None):
+    to_dict = _row_in(currency, _archived_order_row, ORDER_FIELDS + ('products',), _order_converters, 'total_price')
+    for row in queryset.values_list(*ORDER_FIELDS, 'product_ids').iterator(chunk_size=chunk_size):
+        yield to_dict(row)
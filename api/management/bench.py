@@ -0,0 +1,51 @@
+# Shared helpers for the bench_* management commands.
+
+import time
+
+from django.contrib.auth.models import User
+
+from api.models import Cart, CartItem, Order, Product, ProductImage
+
+
+def best_of(repeat, func):
+    # (result, fastest wall time in seconds) over `repeat` calls.
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def seed(rows, username='bench'):
+    # Creates `rows` products, orders and carts and returns querysets over them.
+    # Callers run this inside a transaction they roll back.
+    user = User.objects.create_user(username=username)
+    products = Product.objects.bulk_create(
+        Product(name=f"Bench product {i}", price=f"{i % 500}.{i % 100:02d}",
+                description="Benchmark row – café", quantity=i % 50, is_listed=bool(i % 2))
+        for i in range(rows)
+    )
+    ProductImage.objects.bulk_create(
+        ProductImage(product=product, image=f"product_images/bench-{product.pk}.jpg")
+        for product in products[::2]
+    )
+    orders = Order.objects.bulk_create(
+        Order(user=user, total_price=f"{i % 900}.50") for i in range(rows)
+    )
+    Order.products.through.objects.bulk_create(
+        Order.products.through(order=order, product=products[(i * 7) % rows])
+        for i, order in enumerate(orders)
+    )
+    # One cart per user (unique constraint), so every cart gets its own user
+    owners = User.objects.bulk_create(User(username=f"{username}-{i}") for i in range(rows))
+    carts = Cart.objects.bulk_create(Cart(user=owner, total_price="10.00") for owner in owners)
+    CartItem.objects.bulk_create(
+        CartItem(cart=cart, product=products[i], quantity=1) for i, cart in enumerate(carts)
+    )
+    return (
+        Product.objects.filter(name__startswith="Bench product ").order_by('pk'),
+        Order.objects.filter(user=user).order_by('pk'),
+        Cart.objects.filter(user__username__startswith=f"{username}-").order_by('pk'),
+    )
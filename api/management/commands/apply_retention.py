@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api import retention
+
+
+class Command(BaseCommand):
+    help = "Archive old delivered orders and delete abandoned carts, in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--order-days', type=int, default=settings.ORDER_ARCHIVE_DAYS)
+        parser.add_argument('--cart-days', type=int, default=settings.ABANDONED_CART_DAYS)
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        archived = retention.archive_orders(options['order_days'], options['batch_size'])
+        purged = retention.purge_abandoned_carts(options['cart_days'], options['batch_size'])
+        self.stdout.write(f"Archived {archived} orders, deleted {purged} abandoned carts.")
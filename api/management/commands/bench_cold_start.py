@@ -0,0 +1,76 @@
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a fresh interpreter against a throwaway copy of the database (the
+# path in BENCH_DATABASE): import the WSGI app like a worker would, then time
+# the first and second request through it.
+PROBE = """
+import json, os, sys, time
+from wsgiref.util import setup_testing_defaults
+
+from django.conf import settings
+settings.DATABASES["default"]["NAME"] = os.environ["BENCH_DATABASE"]
+
+start = time.perf_counter()
+from ecom.wsgi import application
+from api import warmup
+if os.environ.get("DJANGO_WARMUP") != "0":
+    warmup.warm_up(connect=True)  # what gunicorn's post_worker_init adds
+boot = time.perf_counter() - start
+
+def request(path):
+    environ = {"PATH_INFO": path, "HTTP_ACCEPT": "application/json"}
+    setup_testing_defaults(environ)
+    start = time.perf_counter()
+    body = application(environ, lambda status, headers: None)
+    for chunk in body:
+        pass
+    return time.perf_counter() - start
+
+first = request(sys.argv[1])
+second = request(sys.argv[1])
+print(json.dumps({"boot": boot, "first": first, "second": second}))
+"""
+
+
+class Command(BaseCommand):
+    help = "Measure worker boot time and first-request latency with and without the warm-up (api/warmup.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/api/products/')
+        parser.add_argument('--runs', type=int, default=5)
+
+    def handle(self, *args, **options):
+        database = settings.DATABASES['default']
+        if database['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError("bench_cold_start copies the database file, so it only supports SQLite.")
+        with tempfile.TemporaryDirectory() as directory:
+            for label, flag in (('cold', '0'), ('warmed', '1')):
+                self.measure(label, flag, Path(database['NAME']), Path(directory) / 'bench.sqlite3', options)
+
+    def measure(self, label, flag, source, copy, options):
+        samples = []
+        for _ in range(options['runs']):
+            shutil.copyfile(source, copy)  # each run starts from the same state
+            env = dict(
+                os.environ, DJANGO_WARMUP=flag, DJANGO_SETTINGS_MODULE='ecom.settings', BENCH_DATABASE=str(copy),
+            )
+            output = subprocess.run(
+                [sys.executable, '-c', PROBE, options['path']],
+                cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True,
+            ).stdout
+            samples.append(json.loads(output.strip().splitlines()[-1]))
+        median = {key: statistics.median(sample[key] for sample in samples) * 1000 for key in samples[0]}
+        self.stdout.write(
+            f"{label:<7} {options['path']} boot={median['boot']:.1f}ms "
+            f"first={median['first']:.1f}ms second={median['second']:.1f}ms (median of {options['runs']})"
+        )
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from api.lean import serialize_carts, serialize_orders, serialize_products
+from api.management.bench import best_of, seed
+from api.renderers import FastJSONRenderer
+from api.serializers import CartSerializer, OrderSerializer, ProductSerializer
+
+
+class Command(BaseCommand):
+    help = "Compare the DRF serializers with the lean fast path (api/lean.py). Seeded rows are rolled back."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        rows, repeat = options['rows'], options['repeat']
+        with transaction.atomic():
+            products, orders, carts = seed(rows, username='bench-serializers')
+            cases = [
+                ('products', ProductSerializer, serialize_products, products.prefetch_related('images')),
+                ('orders', OrderSerializer, serialize_orders, orders.prefetch_related('products')),
+                ('carts', CartSerializer, serialize_carts, carts.prefetch_related('products')),
+            ]
+            for name, serializer_class, lean, queryset in cases:
+                # The DRF side gets prefetch_related so it is not just measuring N+1 queries.
+                slow, slow_s = best_of(repeat, lambda: JSONRenderer().render(
+                    serializer_class(queryset, many=True).data))
+                fast, fast_s = best_of(repeat, lambda: FastJSONRenderer().render(lean(queryset)))
+                if slow != fast:
+                    raise CommandError(f"{name}: lean output differs from {serializer_class.__name__}")
+                self.stdout.write(
+                    f"{name:<9} rows={rows} drf={slow_s * 1000:.1f}ms lean={fast_s * 1000:.1f}ms "
+                    f"speedup={slow_s / fast_s:.1f}x bytes={len(fast)}"
+                )
+            transaction.set_rollback(True)
@@ -0,0 +1,66 @@
+import hashlib
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.lean import iter_orders, iter_products, serialize_orders, serialize_products
+from api.management.bench import seed
+from api.middleware import compress_gzip, compress_gzip_sequence
+from api.renderers import FastJSONRenderer, stream_json
+
+
+def measure(make_chunks):
+    # Consumes the chunks like a WSGI server would, without keeping the body.
+    # Returns (sha1 of the body, bytes, time to first chunk, total time, peak
+    # traced memory).
+    digest, size = hashlib.sha1(), 0
+    tracemalloc.start()
+    start = time.perf_counter()
+    ttfb = None
+    for chunk in make_chunks():
+        if ttfb is None:
+            ttfb = time.perf_counter() - start
+        digest.update(chunk)
+        size += len(chunk)
+    total = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return digest.hexdigest(), size, ttfb, total, peak
+
+
+class Command(BaseCommand):
+    help = "Compare full rendering with streamed JSON for the list endpoints: peak memory and time to first byte. Seeded rows are rolled back."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--level', type=int, default=6, help="gzip level for the compressed runs")
+
+    def handle(self, *args, **options):
+        rows, level = options['rows'], options['level']
+        renderer = FastJSONRenderer()
+        with transaction.atomic():
+            products, orders, _ = seed(rows, username='bench-streaming')
+            cases = [
+                ('products', lambda: renderer.render(serialize_products(products)),
+                 lambda: stream_json(iter_products(products))),
+                ('orders', lambda: renderer.render(serialize_orders(orders)),
+                 lambda: stream_json(iter_orders(orders))),
+            ]
+            for name, full, streamed in cases:
+                runs = [
+                    ('full', lambda: [full()]),
+                    ('streamed', streamed),
+                    ('full+gzip', lambda: [compress_gzip(full(), level)]),
+                    ('streamed+gzip', lambda: compress_gzip_sequence(streamed(), level)),
+                ]
+                results = {label: measure(make_chunks) for label, make_chunks in runs}
+                if results['full'][0] != results['streamed'][0]:
+                    raise CommandError(f"{name}: streamed body differs from the full render")
+                for label, (_, size, ttfb, total, peak) in results.items():
+                    self.stdout.write(
+                        f"{name:<9} {label:<14} rows={rows} bytes={size} ttfb={ttfb * 1000:.1f}ms "
+                        f"total={total * 1000:.1f}ms peak={peak / 1024 / 1024:.2f}MiB"
+                    )
+            transaction.set_rollback(True)
@@ -0,0 +1,37 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.profiling import read, render_svg
+
+
+class Command(BaseCommand):
+    help = (
+        "Merge the request profiles in PROFILE_DIR per URL name into <name>.folded (for flamegraph.pl or "
+        "speedscope) and <name>.svg, and list the slowest SQL statements of each."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', default=str(settings.PROFILE_DIR))
+        parser.add_argument('--output', default=str(Path(settings.PROFILE_DIR) / 'flamegraphs'))
+        parser.add_argument('--url-name', action='append', help="Only these URL names (repeatable)")
+        parser.add_argument('--top-sql', type=int, default=5)
+
+    def handle(self, *args, **options):
+        merged = read(options['source'])
+        if options['url_name']:
+            merged = {name: merged[name] for name in options['url_name'] if name in merged}
+        if not merged:
+            raise CommandError(f"No profiles found in {options['source']}.")
+        output = Path(options['output'])
+        output.mkdir(parents=True, exist_ok=True)
+        for name, (profiles, stacks, queries) in sorted(merged.items()):
+            (output / f'{name}.folded').write_text(''.join(f'{stack} {count}\n' for stack, count in stacks.most_common()))
+            (output / f'{name}.svg').write_text(
+                render_svg(stacks, f'{name}: {profiles} requests, {sum(stacks.values())} samples')
+            )
+            self.stdout.write(f"{name}: {profiles} requests, {sum(stacks.values())} samples -> {output / name}.svg")
+            slowest = sorted(queries.items(), key=lambda item: -item[1][1])[:options['top_sql']]
+            for statement, (calls, seconds) in slowest:
+                self.stdout.write(f"  {seconds * 1000:9.2f}ms {calls:5}x  {statement[:120]}")
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from api import recommendations
+
+
+class Command(BaseCommand):
+    help = "Build the \"frequently bought together\" tables from order baskets."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="recompute everything instead of adding new orders")
+        parser.add_argument('--top-k', type=int, default=recommendations.TOP_K)
+        parser.add_argument('--chunk-size', type=int, default=10000, help="orders scanned per pass")
+
+    def handle(self, *args, **options):
+        build = recommendations.build_full if options['full'] else recommendations.build_incremental
+        products = build(options['top_k'], options['chunk_size'])
+        engine = "scipy" if recommendations.sparse is not None else "python"
+        self.stdout.write(f"Updated neighbours for {products} products ({engine}).")
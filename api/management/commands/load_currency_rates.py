@@ -0,0 +1,50 @@
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.models import CurrencyRate
+
+
+class Command(BaseCommand):
+    help = (
+        "Load currency rates from a JSON file (default CURRENCY_RATES_FILE): "
+        '{"base": "INR", "rates": {"USD": "0.012", "JPY": {"rate": "1.78", "decimal_places": 0}}}. '
+        "Existing codes are updated; --replace also deletes codes missing from the file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=str(settings.CURRENCY_RATES_FILE))
+        parser.add_argument('--replace', action='store_true')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path']) as f:
+                table = json.load(f)
+        except (OSError, ValueError) as exc:
+            raise CommandError(f"Cannot read {options['path']}: {exc}")
+        if table.get('base', settings.BASE_CURRENCY).upper() != settings.BASE_CURRENCY:
+            raise CommandError(f"Rates are for {table['base']}, prices are stored in {settings.BASE_CURRENCY}.")
+
+        rows = []
+        for code, entry in table.get('rates', {}).items():
+            entry = entry if isinstance(entry, dict) else {'rate': entry}
+            try:
+                rate = Decimal(str(entry['rate']))
+                decimal_places = int(entry.get('decimal_places', 2))
+            except (KeyError, InvalidOperation, ValueError):
+                raise CommandError(f"Invalid entry for {code}: {entry}")
+            if rate <= 0 or not 0 <= decimal_places <= 4:
+                raise CommandError(f"Invalid entry for {code}: {entry}")
+            rows.append(CurrencyRate(code=code.upper(), rate=rate, decimal_places=decimal_places))
+
+        with transaction.atomic():
+            CurrencyRate.objects.bulk_create(
+                rows, update_conflicts=True, unique_fields=['code'], update_fields=['rate', 'decimal_places', 'updated_at'],
+            )
+            deleted = 0
+            if options['replace']:
+                deleted, _ = CurrencyRate.objects.exclude(code__in=[row.code for row in rows]).delete()
+        self.stdout.write(f"Loaded {len(rows)} currency rates, deleted {deleted}.")
@@ -0,0 +1,12 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.profiling import new_token
+
+
+class Command(BaseCommand):
+    help = "Print an X-Profile header value; requests sending it are profiled (see ProfilingMiddleware)."
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"X-Profile: {new_token()}")
+        self.stderr.write(f"Valid for {settings.PROFILE_TOKEN_MAX_AGE} seconds.")
@@ -0,0 +1,29 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.models import GuestCart
+
+
+class Command(BaseCommand):
+    help = "Delete guest carts not touched for --seconds (default GUEST_CART_TTL), in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=int, default=settings.GUEST_CART_TTL)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(seconds=options['seconds'])
+        expired = GuestCart.objects.filter(updated_at__lt=cutoff).order_by('pk')
+        deleted = 0
+        # Small batches, each in its own autocommit statement, so the table is
+        # never locked for long.
+        while True:
+            batch = list(expired.values_list('pk', flat=True)[:options['batch_size']])
+            if not batch:
+                break
+            expired.filter(pk__in=batch).delete()
+            deleted += len(batch)
+        self.stdout.write(f"Deleted {deleted} guest carts.")
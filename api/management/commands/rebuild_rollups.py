@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api import analytics
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily sales rollups from all orders."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000, help="orders scanned per pass")
+
+    def handle(self, *args, **options):
+        status_rows, product_rows = analytics.rebuild(chunk_size=options['chunk_size'])
+        engine = "numpy" if analytics.np is not None else "python"
+        self.stdout.write(f"Rebuilt {status_rows} status rows and {product_rows} product rows ({engine}).")
@@ -0,0 +1,168 @@
+# middleware.py
+
+import random
+import zlib
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+from . import profiling, warmup
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, only gzip is offered without it
+    brotli = None
+
+
+def accepted_encodings(header):
+    # Codings from an Accept-Encoding header, minus the ones sent with q=0.
+    accepted = set()
+    for part in header.lower().split(','):
+        coding, _, params = part.partition(';')
+        params = params.replace(' ', '')
+        if params.startswith('q=') and params[2:].strip('0.') == '':
+            continue
+        accepted.add(coding.strip())
+    return accepted
+
+
+def gzip_compressor(level):
+    return zlib.compressobj(level, zlib.DEFLATED, 31)
+
+
+def compress_gzip(data, level):
+    compressor = gzip_compressor(level)
+    return compressor.compress(data) + compressor.flush()
+
+
+def compress_gzip_sequence(sequence, level):
+    compressor = gzip_compressor(level)
+    for item in sequence:
+        data = compressor.compress(item)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def compress_brotli(data, level):
+    return brotli.compress(data, quality=level)
+
+
+def compress_brotli_sequence(sequence, level):
+    compressor = brotli.Compressor(quality=level)
+    for item in sequence:
+        data = compressor.process(item)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Compress responses with brotli or gzip, whichever the client accepts
+    (brotli first). Only content types listed in COMPRESSION_LEVELS are
+    compressed, each with its own level, and buffered responses shorter than
+    COMPRESSION_MIN_SIZE are left alone. Streaming responses are compressed
+    chunk by chunk.
+    """
+
+    def process_response(self, request, response):
+        if response.has_header("Content-Encoding"):
+            return response
+
+        content_type = response.get("Content-Type", "").split(";")[0].strip()
+        levels = settings.COMPRESSION_LEVELS.get(content_type)
+        if not levels:
+            return response
+        if not response.streaming and len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+
+        accepted = accepted_encodings(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if brotli is not None and "br" in accepted and "br" in levels:
+            encoding, compress, compress_sequence = "br", compress_brotli, compress_brotli_sequence
+        elif "gzip" in accepted and "gzip" in levels:
+            encoding, compress, compress_sequence = "gzip", compress_gzip, compress_gzip_sequence
+        else:
+            return response
+        level = levels[encoding]
+
+        if response.streaming:
+            if response.is_async:
+                return response
+            response.streaming_content = compress_sequence(response.streaming_content, level)
+            del response.headers["Content-Length"]
+        else:
+            compressed_content = compress(response.content, level)
+            if len(compressed_content) >= len(response.content):
+                return response
+            response.content = compressed_content
+            response.headers["Content-Length"] = str(len(response.content))
+
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = encoding
+        return response
+
+
+class HealthCheckMiddleware:
+    """
+    Answer /healthz (process is up) and /readyz (warm-up has run) before any
+    other middleware, so probes never touch sessions, auth, host validation
+    or the database. Keep it first in MIDDLEWARE.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.path == "/healthz":
+            return HttpResponse("ok", content_type="text/plain")
+        if request.path == "/readyz":
+            if warmup.ready:
+                return HttpResponse("ready", content_type="text/plain")
+            return HttpResponse("warming up", content_type="text/plain", status=503)
+        return self.get_response(request)
+
+
+class ProfilingMiddleware:
+    """
+    Profile requests that carry a valid X-Profile token (manage.py
+    profile_token) and, when PROFILE_SAMPLE_RATE is above 0, that fraction of
+    all other requests. See api/profiling.py. The profile file name is sent
+    back in the X-Profile response header. Streaming bodies are produced after
+    the profile has ended and are not part of it.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = request.META.get(profiling.HEADER)
+        sampled = settings.PROFILE_SAMPLE_RATE and random.random() < settings.PROFILE_SAMPLE_RATE
+        if not sampled and not (token and profiling.valid_token(token)):
+            return self.get_response(request)
+
+        sampler = profiling.Sampler(settings.PROFILE_INTERVAL)
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(sampler.execute))
+            sampler.start()
+            try:
+                response = self.get_response(request)
+            finally:
+                sampler.stop()
+
+        match = request.resolver_match
+        url_name = match.url_name if match and match.url_name else "unresolved"
+        try:
+            response["X-Profile"] = profiling.write(sampler, request, response, url_name)
+        except OSError:
+            pass  # a full or read-only disk must not fail the request
+        return response
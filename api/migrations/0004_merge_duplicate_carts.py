@@ -0,0 +1,83 @@
+# Merges duplicate carts and cart items so the unique constraints added in
+# 0005 can be created. Runs set-based: one pass to move items to each user's
+# oldest cart, one to fold duplicate (cart, product) rows into a single row,
+# one UPDATE to recompute the affected totals.
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+BATCH_SIZE = 500
+
+
+def merge_duplicate_carts(apps, schema_editor):
+    Cart = apps.get_model("api", "Cart")
+    CartItem = apps.get_model("api", "CartItem")
+    db = schema_editor.connection.alias
+    carts = Cart.objects.using(db)
+    items = CartItem.objects.using(db)
+
+    # Every cart of a user with several carts points at the user's oldest one.
+    duplicate_users = (
+        carts.values("user").annotate(count=Count("id"), keep=Min("id")).filter(count__gt=1)
+    )
+    keep_by_user = {row["user"]: row["keep"] for row in duplicate_users}
+    keep_by_cart = {
+        cart_id: keep_by_user[user_id]
+        for cart_id, user_id in carts.filter(user__in=keep_by_user).values_list("id", "user")
+        if cart_id != keep_by_user[user_id]
+    }
+    moved = list(items.filter(cart__in=keep_by_cart).only("id", "cart"))
+    for item in moved:
+        item.cart_id = keep_by_cart[item.cart_id]
+    items.bulk_update(moved, ["cart"], batch_size=BATCH_SIZE)
+    carts.filter(id__in=keep_by_cart).delete()
+
+    # Duplicate (cart, product) rows collapse into the oldest row.
+    duplicate_items = (
+        items.values("cart", "product")
+        .annotate(count=Count("id"), keep=Min("id"), total=Sum("quantity"))
+        .filter(count__gt=1)
+    )
+    keep = {}
+    for row in duplicate_items:
+        keep[(row["cart"], row["product"])] = (row["keep"], row["total"])
+    affected_carts = set(keep_by_user.values()) | {cart_id for cart_id, _ in keep}
+    if keep:
+        rows = items.filter(cart__in={cart_id for cart_id, _ in keep}).only("id", "cart", "product", "quantity")
+        kept, removed = [], []
+        for item in rows:
+            pair = keep.get((item.cart_id, item.product_id))
+            if pair is None:
+                continue
+            if item.id == pair[0]:
+                item.quantity = pair[1]
+                kept.append(item)
+            else:
+                removed.append(item.id)
+        items.bulk_update(kept, ["quantity"], batch_size=BATCH_SIZE)
+        for start in range(0, len(removed), BATCH_SIZE):
+            items.filter(id__in=removed[start:start + BATCH_SIZE]).delete()
+
+    subtotal = (
+        CartItem.objects.using(db)
+        .filter(cart=OuterRef("pk"))
+        .values("cart")
+        .annotate(total=Sum(F("product__price") * F("quantity")))
+        .values("total")
+    )
+    affected = sorted(affected_carts)
+    for start in range(0, len(affected), BATCH_SIZE):
+        carts.filter(id__in=affected[start:start + BATCH_SIZE]).update(
+            total_price=Coalesce(Subquery(subtotal), Value(0), output_field=models.DecimalField())
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0003_alter_cart_total_price"),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_carts, migrations.RunPython.noop),
+    ]
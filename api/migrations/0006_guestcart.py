@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-19 10:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0005_cart_constraints_order_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GuestCart",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("key", models.CharField(max_length=32, unique=True)),
+                ("items", models.JSONField(default=dict)),
+                ("updated_at", models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+        ),
+    ]
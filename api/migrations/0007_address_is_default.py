@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-19 10:50
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def mark_latest_address_default(apps, schema_editor):
+    # GetAddressView used to return each profile's newest address; that one
+    # becomes the default.
+    Address = apps.get_model("api", "Address")
+    addresses = Address.objects.using(schema_editor.connection.alias)
+    latest = addresses.values("user_profile").annotate(latest=Max("id")).values("latest")
+    addresses.filter(id__in=latest).update(is_default=True)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0006_guestcart"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="address",
+            name="is_default",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(mark_latest_address_default, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="address",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("is_default", True)),
+                fields=("user_profile",),
+                name="unique_default_address",
+            ),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-19 11:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0011_version_columns"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CurrencyRate",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("code", models.CharField(max_length=3, unique=True)),
+                ("rate", models.DecimalField(decimal_places=8, max_digits=18)),
+                ("decimal_places", models.PositiveSmallIntegerField(default=2)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
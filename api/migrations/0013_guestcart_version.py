@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-19 11:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0012_currency_rates"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="guestcart",
+            name="version",
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -1,6 +1,11 @@
 # models.py
 
-from django.db import models
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import connections, models, transaction
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
 from django.contrib.auth.models import User as DjangoUser
 
 class UserProfile(models.Model):
@@ -17,6 +22,56 @@ class Address(models.Model):
     state = models.CharField(max_length=100)
     country = models.CharField(max_length=100)
     pincode = models.CharField(max_length=10)
+    is_default = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user_profile'], condition=models.Q(is_default=True), name='unique_default_address',
+            ),
+        ]
+
+
+class ProductQuerySet(models.QuerySet):
+    def bulk_patch(self, price_percent=None, is_listed=None, quantity_delta=None, chunk_size=500):
+        # Applies one patch to every product in the queryset, chunk by chunk in
+        # a single transaction, and bumps their versions. Flag and stock changes
+        # are one UPDATE per chunk; price changes are rounded half-up in Python
+        # and written with bulk_update, after which the totals of the carts
+        # holding those products are recomputed in one statement per chunk.
+        # Returns (ids of the products patched, number of carts updated).
+        # Raises ValueError, with nothing written, when a new price would not
+        # fit the price column.
+        ids = list(self.order_by('pk').values_list('pk', flat=True))
+        carts = 0
+        price_field = Product._meta.get_field('price')
+        price_limit = Decimal(10) ** (price_field.max_digits - price_field.decimal_places)
+        with transaction.atomic(using=self.db):
+            for start in range(0, len(ids), chunk_size):
+                chunk = Product.objects.using(self.db).filter(pk__in=ids[start:start + chunk_size])
+                if price_percent is None:
+                    changes = {'version': F('version') + 1}
+                    if is_listed is not None:
+                        changes['is_listed'] = is_listed
+                    if quantity_delta is not None:
+                        changes['quantity'] = Greatest(F('quantity') + quantity_delta, Value(0))
+                    chunk.update(**changes)
+                    continue
+                factor = 1 + Decimal(price_percent) / 100
+                products = list(chunk.select_for_update().only('pk', 'price', 'quantity', 'is_listed', 'version'))
+                for product in products:
+                    product.price = (product.price * factor).quantize(Decimal('0.01'), ROUND_HALF_UP)
+                    if product.price >= price_limit:
+                        raise ValueError(f"The new price of product {product.pk} would be {product.price}, above the maximum.")
+                    product.version += 1
+                    if is_listed is not None:
+                        product.is_listed = is_listed
+                    if quantity_delta is not None:
+                        product.quantity = max(product.quantity + quantity_delta, 0)
+                Product.objects.using(self.db).bulk_update(products, ['price', 'quantity', 'is_listed', 'version'])
+                holding = CartItem.objects.filter(product__in=chunk).values('cart_id')
+                carts += Cart.objects.using(self.db).filter(pk__in=holding).update_totals(touch=False)
+        return ids, carts
 
 
 class Product(models.Model):
@@ -26,6 +81,18 @@ class Product(models.Model):
     description = models.TextField()
     quantity = models.IntegerField()
     is_listed = models.BooleanField(default=True)
+    version = models.PositiveIntegerField(default=1)  # bumped by every write, see views.if_match_version
+
+    objects = ProductQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        # ORM saves of an existing product (the Django admin, scripts) are
+        # writes too; update() callers bump the version themselves.
+        if not self._state.adding:
+            self.version += 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+        super().save(*args, **kwargs)
 
 
 class ProductImage(models.Model):
@@ -36,20 +103,84 @@ class ProductImage(models.Model):
         return f"Image for {self.product.name}"
     
 
+class CartQuerySet(models.QuerySet):
+    def update_totals(self, touch=True):
+        # Recomputes total_price for every cart in the queryset in one UPDATE.
+        # touch=False leaves updated_at alone (for changes the owner did not make).
+        subtotal = (
+            CartItem.objects.filter(cart=OuterRef('pk'))
+            .values('cart')
+            .annotate(total=Sum(F('product__price') * F('quantity')))
+            .values('total')
+        )
+        changes = {'total_price': Coalesce(Subquery(subtotal), Value(0), output_field=models.DecimalField())}
+        if touch:
+            changes['updated_at'] = timezone.now()
+        return self.update(**changes)
+
+
 class Cart(models.Model):
     user = models.ForeignKey(DjangoUser, on_delete=models.CASCADE)
     products = models.ManyToManyField(Product, through='CartItem')
     total_price = models.DecimalField(max_digits=10, decimal_places=2,default=0.00)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = CartQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user'], name='unique_cart_per_user'),
+        ]
+
+    def refresh_total(self):
+        Cart.objects.filter(pk=self.pk).update_totals()
+        self.refresh_from_db(fields=['total_price'])
+
+
+class CartItemQuerySet(models.QuerySet):
+    def upsert(self, cart_id, product_id, quantity=1, increment=True):
+        return self.upsert_many(cart_id, {product_id: quantity}, increment=increment)
+
+    def upsert_many(self, cart_id, quantities, increment=True):
+        # One INSERT ... ON CONFLICT on (cart, product) for {product_id: quantity}:
+        # adds the quantity to existing rows (or leaves them alone when
+        # increment is False), so concurrent adds never create duplicates or
+        # lose updates.
+        if not quantities:
+            return
+        connection = connections[self.db]
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        if increment:
+            on_conflict = f"DO UPDATE SET quantity = {table}.quantity + excluded.quantity"
+        else:
+            on_conflict = "DO NOTHING"
+        values = ", ".join(["(%s, %s, %s)"] * len(quantities))
+        params = []
+        for product_id, quantity in quantities.items():
+            params += [cart_id, product_id, quantity]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (cart_id, product_id, quantity) VALUES {values} "
+                f"ON CONFLICT (cart_id, product_id) {on_conflict}",
+                params,
+            )
+
 
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
 
+    objects = CartItemQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product'], name='unique_cart_item_product'),
+        ]
+
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
-        self.cart.total_price = sum(item.product.price * item.quantity for item in self.cart.cartitem_set.all())
-        self.cart.save()
+        self.cart.refresh_total()
 
 class Order(models.Model):
     STATUS_CHOICES = [
@@ -61,9 +192,124 @@ class Order(models.Model):
     products = models.ManyToManyField(Product)
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='CONFIRMED')
+    created_at = models.DateTimeField(default=timezone.now)
+    version = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'status'], name='order_user_status_idx'),
+        ]
 
 class AdminOrder(models.Model):
     order = models.OneToOneField(Order, on_delete=models.CASCADE)
 
 
+class ArchivedOrder(models.Model):
+    # Delivered orders moved out of Order by api/retention.py. id is the
+    # original Order id, so paging by id runs on from live orders into here.
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(DjangoUser, on_delete=models.CASCADE)
+    total_price = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    created_at = models.DateTimeField()
+    version = models.PositiveIntegerField(default=1)
+    product_ids = models.JSONField(default=list)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-id'], name='archived_order_user_id_idx'),
+        ]
+
+
+# Sales rollups, kept up to date by api/signals.py and rebuilt from scratch by
+# `manage.py rebuild_rollups` (see api/analytics.py).
+
+class DailyProductSales(models.Model):
+    day = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    units = models.IntegerField(default=0)  # orders containing the product
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'product'], name='unique_daily_product_sales'),
+        ]
+
+
+class DailyStatusSales(models.Model):
+    day = models.DateField()
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    orders = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'status'], name='unique_daily_status_sales'),
+        ]
+
+
+
+
+
+class GuestCart(models.Model):
+    # An anonymous cart (see api/guest_cart.py). items is {product_id: quantity}.
+    key = models.CharField(max_length=32, unique=True)
+    items = models.JSONField(default=dict)
+    version = models.PositiveIntegerField(default=1)  # bumped by every write, see guest_cart.save
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+
+# "Frequently bought together", built by `manage.py build_recommendations`
+# (see api/recommendations.py).
+
+class CoPurchase(models.Model):
+    # Sparse item-item co-occurrence counts; stored in both directions.
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    other = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'other'], name='unique_co_purchase'),
+        ]
+
+
+class RelatedProduct(models.Model):
+    # Top-K neighbours per product, ranked from 0.
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    score = models.IntegerField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'rank'], name='unique_related_product_rank'),
+        ]
+
+
+class RecommendationBuild(models.Model):
+    # One row per build; incremental builds start after the latest last_order_id.
+    last_order_id = models.BigIntegerField()
+    full = models.BooleanField(default=False)
+    finished_at = models.DateTimeField(auto_now_add=True)
+
+
+class CurrencyRate(models.Model):
+    # One unit of settings.BASE_CURRENCY is worth `rate` units of `code`;
+    # converted amounts are rounded to `decimal_places`. See api/currency.py.
+    code = models.CharField(max_length=3, unique=True)
+    rate = models.DecimalField(max_digits=18, decimal_places=8)
+    decimal_places = models.PositiveSmallIntegerField(default=2)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.code} {self.rate}"
+
 
+class CacheGeneration(models.Model):
+    # A counter bumped in every transaction that changes the data behind a
+    # process-local cache, so each process can tell when to drop its copy.
+    # See api/product_cache.py.
+    name = models.CharField(max_length=50, unique=True)
+    value = models.PositiveBigIntegerField(default=0)
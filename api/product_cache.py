@@ -0,0 +1,56 @@
+# product_cache.py
+#
+# Per-product entries for client-side hydration (ProductBatchView): the
+# product's fields as ProductSerializer shows them, plus the storage name of
+# its primary (first) image, kept in process memory.
+#
+# Every write to a product or one of its images bumps the "product"
+# CacheGeneration row after the data is written: signals.py does it for ORM
+# saves and deletes, and the callers of QuerySet.update(), bulk_update() and
+# bulk_create() on products do it themselves. get_many() reads that row first
+# (one query) and drops all entries when it changed, so a write made by any
+# process, including creating a product that was cached as missing, is seen
+# by every process on its next request.
+
+from django.conf import settings
+
+from .db import add_counts
+from .lean import PRODUCT_FIELDS, compile_row, decimal_to_string
+from .models import CacheGeneration, Product, ProductImage
+
+GENERATION = 'product'
+
+_row = compile_row(PRODUCT_FIELDS, {'price': decimal_to_string(Product, 'price')})
+_cache = (None, {})  # (generation, {id: entry, or False for an id that does not exist})
+
+
+def invalidate():
+    add_counts(CacheGeneration, ['name'], ['value'], {(GENERATION,): (1,)})
+
+
+def clear():
+    # Drops this process's entries only; for tests and benchmarks.
+    global _cache
+    _cache = (None, {})
+
+
+def get_many(ids):
+    # {id: entry} for the ids that exist: cache hits first, the rest with one
+    # product query and one image query, which are then cached.
+    global _cache
+    generation = CacheGeneration.objects.filter(name=GENERATION).values_list('value', flat=True).first()
+    if _cache[0] != generation or len(_cache[1]) > settings.PRODUCT_CACHE_SIZE:
+        _cache = (generation, {})
+    entries = _cache[1]
+    misses = [pk for pk in ids if pk not in entries]
+    if misses:
+        images = {}
+        rows = ProductImage.objects.filter(product_id__in=misses).order_by('product_id', 'id')
+        for product_id, image in rows.values_list('product_id', 'image'):
+            images.setdefault(product_id, image)
+        loaded = {
+            row[0]: {**_row(row), 'image': images.get(row[0])}
+            for row in Product.objects.filter(pk__in=misses).values_list(*PRODUCT_FIELDS)
+        }
+        entries.update({pk: loaded.get(pk, False) for pk in misses})
+    return {pk: entries[pk] for pk in ids if entries[pk] is not False}
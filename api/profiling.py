@@ -0,0 +1,181 @@
+# profiling.py
+#
+# Opt-in request profiling (middleware.ProfilingMiddleware). A profiled
+# request gets a Sampler: a background thread that records the request
+# thread's Python stack every PROFILE_INTERVAL seconds. While a SQL statement
+# is running, the sample gets the statement as an extra leaf frame, so time
+# spent in the database shows up under the code that issued the query.
+#
+# Each profile is written to PROFILE_DIR as one collapsed-stack file
+# ("frame;frame;frame count" per line, the format flamegraph.pl reads). It
+# starts with "#" comment lines holding the request and every SQL statement
+# with its duration. Only the newest PROFILE_MAX_FILES files are kept.
+# manage.py build_flamegraphs merges them per URL name.
+
+import os
+import sys
+import threading
+import time
+import zlib
+from collections import Counter, defaultdict
+from html import escape
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+
+SALT = 'api.profile'
+HEADER = 'HTTP_X_PROFILE'
+SUFFIX = '.folded'
+
+
+def new_token():
+    # Value for the X-Profile header, valid for PROFILE_TOKEN_MAX_AGE seconds.
+    return signing.TimestampSigner(salt=SALT).sign('profile')
+
+
+def valid_token(token):
+    try:
+        signing.TimestampSigner(salt=SALT).unsign(token, max_age=settings.PROFILE_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def _statement(sql):
+    # One line, no ";" (the collapsed-stack frame separator), bounded length.
+    return ' '.join(sql.split()).replace(';', ',')[:200]
+
+
+def _frame(code):
+    path = Path(code.co_filename)
+    return f'{code.co_name} ({"/".join(path.parts[-2:])}:{code.co_firstlineno})'
+
+
+class Sampler:
+    def __init__(self, interval):
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.stacks = Counter()
+        self.queries = []  # (seconds, statement)
+        self.sql = None  # statement in flight, read by the sampling thread
+        self.elapsed = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-sampler', daemon=True)
+
+    def start(self):
+        self._start = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.perf_counter() - self._start
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None and frame.f_code is Sampler.stop.__code__:
+                break  # the request is over
+            frames = []
+            while frame is not None:
+                frames.append(_frame(frame.f_code))
+                frame = frame.f_back
+            if not frames:
+                continue
+            frames.reverse()
+            sql = self.sql
+            if sql is not None:
+                frames.append(f'SQL {sql}')
+            self.stacks[';'.join(frames)] += 1
+
+    def execute(self, execute, sql, params, many, context):
+        # connection.execute_wrapper() hook.
+        statement = _statement(sql)
+        self.sql = statement
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql = None
+            self.queries.append((time.perf_counter() - start, statement))
+
+
+def write(sampler, request, response, url_name):
+    # Stores one profile, drops the oldest beyond PROFILE_MAX_FILES and returns
+    # the file name.
+    directory = Path(settings.PROFILE_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    lines = [
+        f'# {url_name} {request.method} {request.path} {response.status_code} '
+        f'{sampler.elapsed * 1000:.1f}ms {len(sampler.queries)} queries',
+        *(f'# sql {seconds * 1000:.2f}ms {statement}' for seconds, statement in sampler.queries),
+        *(f'{stack} {count}' for stack, count in sampler.stacks.items()),
+    ]
+    name = f'{time.time_ns()}-{url_name}{SUFFIX}'
+    temporary = directory / f'.{name}'
+    temporary.write_text('\n'.join(lines) + '\n')
+    os.replace(temporary, directory / name)
+
+    profiles = sorted(directory.glob(f'*{SUFFIX}'))
+    for path in profiles[:max(len(profiles) - settings.PROFILE_MAX_FILES, 0)]:
+        path.unlink(missing_ok=True)
+    return name
+
+
+def read(directory):
+    # {url name: (profile count, Counter of stacks, {statement: [calls, seconds]})}.
+    merged = defaultdict(lambda: (Counter(), defaultdict(lambda: [0, 0.0]), []))
+    for path in sorted(Path(directory).glob(f'*{SUFFIX}')):
+        stacks, queries, profiles = None, None, None
+        for line in path.read_text().splitlines():
+            if line.startswith('# sql '):
+                duration, statement = line[len('# sql '):].split(' ', 1)
+                queries[statement][0] += 1
+                queries[statement][1] += float(duration[:-2]) / 1000
+            elif line.startswith('# '):
+                stacks, queries, profiles = merged[line[2:].split(' ', 1)[0]]
+                profiles.append(path.name)
+            elif line and stacks is not None:
+                stack, count = line.rsplit(' ', 1)
+                stacks[stack] += int(count)
+    return {name: (len(profiles), stacks, queries) for name, (stacks, queries, profiles) in merged.items()}
+
+
+def render_svg(stacks, title, width=1200, row=16):
+    # A plain icicle-style flame graph: the root on top, children below,
+    # widths proportional to samples. Hover a frame for its full name.
+    root = {}
+    for stack, count in stacks.items():
+        node = root
+        for frame in stack.split(';'):
+            child = node.setdefault(frame, [0, {}])
+            child[0] += count
+            node = child[1]
+    total = sum(stacks.values()) or 1
+    rects, depth = [], 0
+
+    def place(children, x, level):
+        nonlocal depth
+        depth = max(depth, level + 1)
+        for frame, (count, grandchildren) in sorted(children.items()):
+            w = width * count / total
+            if w >= 0.5:
+                y = 24 + level * row
+                label = escape(frame if len(frame) * 7 < w else frame[:max(int(w / 7) - 2, 0)] + '..' if w > 21 else '')
+                hue = 30 if frame.startswith('SQL ') else 0
+                rects.append(
+                    f'<g><title>{escape(frame)} ({count} samples, {100 * count / total:.1f}%)</title>'
+                    f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{row - 1}" '
+                    f'fill="hsl({hue + 10 + zlib.crc32(frame.encode()) % 30},80%,60%)"/>'
+                    f'<text x="{x + 3:.1f}" y="{y + row - 4}" font-size="11">{label}</text></g>'
+                )
+                place(grandchildren, x, level + 1)
+            x += w
+
+    place(root, 0, 0)
+    height = 24 + depth * row + 8
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" font-family="monospace">'
+        f'<text x="4" y="16" font-size="13">{escape(title)}</text>{"".join(rects)}</svg>\n'
+    )
@@ -0,0 +1,186 @@
+# recommendations.py
+#
+# "Frequently bought together" from order baskets.
+#
+# CoPurchase holds the sparse product x product co-occurrence counts. A full
+# build computes them as X.T @ X over the order x product incidence matrix
+# (SciPy sparse when installed, plain Python counting otherwise) and covers
+# live and archived orders. An incremental build only adds the baskets of
+# orders newer than the last build. Either way, only products whose counts
+# changed get their top-K RelatedProduct rows rewritten, so serving is one
+# indexed lookup.
+#
+# Orders are created together with their products in one transaction (see
+# the order views), so a build never sees an order without its basket.
+
+import heapq
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Max, Sum
+from django.utils import timezone
+
+from .db import add_counts
+from .models import (
+    ArchivedOrder, CoPurchase, DailyProductSales, Order, Product, RecommendationBuild, RelatedProduct,
+)
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # numpy/scipy are optional, pairs are counted in Python without them
+    np = sparse = None
+
+TOP_K = 10
+BATCH_SIZE = 500
+
+
+def _baskets(after=0, upto=None, chunk_size=10000, archived=False):
+    # Yields lists of baskets (product id lists), one list per order-id window.
+    through = Order.products.through
+    upto = upto if upto is not None else Order.objects.aggregate(high=Max('pk'))['high'] or 0
+    for start in range(after + 1, upto + 1, chunk_size):
+        end = min(start + chunk_size - 1, upto)
+        baskets = defaultdict(list)
+        rows = through.objects.filter(order_id__gte=start, order_id__lte=end).values_list('order_id', 'product_id')
+        for order_id, product_id in rows:
+            baskets[order_id].append(product_id)
+        yield list(baskets.values())
+    if archived:
+        product_ids = ArchivedOrder.objects.values_list('product_ids', flat=True)
+        basket_list = []
+        for ids in product_ids.iterator(chunk_size=chunk_size):
+            basket_list.append(ids)
+            if len(basket_list) == chunk_size:
+                yield basket_list
+                basket_list = []
+        yield basket_list
+
+
+def count_pairs(baskets):
+    # {(product, other): number of baskets containing both}, both directions.
+    baskets = [basket for basket in baskets if len(basket) > 1]
+    if not baskets:
+        return {}
+    if sparse is not None:
+        rows = np.repeat(np.arange(len(baskets)), [len(basket) for basket in baskets])
+        cols = np.fromiter((product_id for basket in baskets for product_id in basket), dtype=np.int64, count=len(rows))
+        incidence = sparse.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, cols)), shape=(len(baskets), cols.max() + 1))
+        incidence.data[:] = 1  # a product listed twice in one basket counts once
+        co = (incidence.T @ incidence).tocoo()
+        off_diagonal = co.row != co.col
+        return dict(zip(
+            zip(co.row[off_diagonal].tolist(), co.col[off_diagonal].tolist()),
+            co.data[off_diagonal].tolist(),
+        ))
+    counts = Counter()
+    for basket in baskets:
+        items = set(basket)
+        for product_id in items:
+            for other in items:
+                if product_id != other:
+                    counts[product_id, other] += 1
+    return counts
+
+
+def _top_k(counts, k):
+    # {product: [(other, count), ...]} best first, ties broken by lower id.
+    grouped = defaultdict(list)
+    for (product_id, other), count in counts:
+        grouped[product_id].append((count, -other))
+    return {
+        product_id: [(-negated, count) for count, negated in heapq.nlargest(k, candidates)]
+        for product_id, candidates in grouped.items()
+    }
+
+
+def _write_related(top, product_ids=None):
+    # Replaces the RelatedProduct rows of `product_ids` (all rows when None).
+    with transaction.atomic():
+        if product_ids is None:
+            RelatedProduct.objects.all().delete()
+        else:
+            ids = list(product_ids)
+            for start in range(0, len(ids), BATCH_SIZE):
+                RelatedProduct.objects.filter(product_id__in=ids[start:start + BATCH_SIZE]).delete()
+        RelatedProduct.objects.bulk_create(
+            (
+                RelatedProduct(product_id=product_id, related_id=other, score=count, rank=rank)
+                for product_id, neighbours in top.items()
+                for rank, (other, count) in enumerate(neighbours)
+            ),
+            batch_size=1000,
+        )
+
+
+def build_full(k=TOP_K, chunk_size=10000):
+    # Recomputes every co-occurrence count and neighbour list. Returns the
+    # number of products that have neighbours.
+    upto = Order.objects.aggregate(high=Max('pk'))['high'] or 0
+    counts = Counter()
+    for baskets in _baskets(upto=upto, chunk_size=chunk_size, archived=True):
+        counts.update(count_pairs(baskets))
+    existing = set(Product.objects.values_list('pk', flat=True))
+    counts = {pair: count for pair, count in counts.items() if pair[0] in existing and pair[1] in existing}
+    top = _top_k(counts.items(), k)
+    with transaction.atomic():
+        CoPurchase.objects.all().delete()
+        CoPurchase.objects.bulk_create(
+            (CoPurchase(product_id=product_id, other_id=other, count=count) for (product_id, other), count in counts.items()),
+            batch_size=1000,
+        )
+        _write_related(top)
+        RecommendationBuild.objects.create(last_order_id=upto, full=True)
+    return len(top)
+
+
+def build_incremental(k=TOP_K, chunk_size=10000):
+    # Adds the baskets of orders placed since the last build and refreshes the
+    # neighbour lists of the products involved. Returns that product count.
+    last = RecommendationBuild.objects.order_by('-id').first()
+    if last is None:
+        return build_full(k, chunk_size)
+    upto = Order.objects.aggregate(high=Max('pk'))['high'] or 0
+    counts = Counter()
+    for baskets in _baskets(after=last.last_order_id, upto=upto, chunk_size=chunk_size):
+        counts.update(count_pairs(baskets))
+    existing = set(Product.objects.filter(pk__in={product_id for product_id, _ in counts}).values_list('pk', flat=True))
+    deltas = {pair: (count,) for pair, count in counts.items() if pair[0] in existing and pair[1] in existing}
+    affected = {product_id for product_id, _ in deltas}
+    with transaction.atomic():
+        add_counts(CoPurchase, ('product', 'other'), ('count',), deltas)
+        ids = list(affected)
+        rows = []
+        for start in range(0, len(ids), BATCH_SIZE):
+            rows += CoPurchase.objects.filter(product_id__in=ids[start:start + BATCH_SIZE]).values_list('product_id', 'other_id', 'count')
+        _write_related(_top_k((((product_id, other), count) for product_id, other, count in rows), k), affected)
+        RecommendationBuild.objects.create(last_order_id=max(upto, last.last_order_id))
+    return len(affected)
+
+
+def fallback(product_id, k=TOP_K):
+    # Cold start: recent best sellers, then newest listed products.
+    # Returns (rows, source) with rows shaped like related().
+    listed = Product.objects.filter(is_active=True, is_listed=True).exclude(pk=product_id)
+    since = timezone.localdate() - timedelta(days=30)
+    best = (
+        DailyProductSales.objects.filter(day__gte=since, product__in=listed)
+        .values('product').annotate(units=Sum('units')).filter(units__gt=0).order_by('-units', 'product')[:k]
+    )
+    best = {row['product']: row['units'] for row in best}
+    if best:
+        products = listed.filter(pk__in=best).values_list('pk', 'name', 'price')
+        rows = sorted(((pk, name, price, best[pk]) for pk, name, price in products), key=lambda row: (-row[3], row[0]))
+        return rows, 'best-sellers'
+    rows = [(pk, name, price, 0) for pk, name, price in listed.order_by('-pk').values_list('pk', 'name', 'price')[:k]]
+    return rows, 'newest'
+
+
+def related(product_id):
+    # [(id, name, price, score)] for a product's neighbours that are on sale.
+    return list(
+        RelatedProduct.objects.filter(product_id=product_id, related__is_active=True, related__is_listed=True)
+        .order_by('rank')
+        .values_list('related_id', 'related__name', 'related__price', 'score')
+    )
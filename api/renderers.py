@@ -0,0 +1,47 @@
+# renderers.py
+
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, the stock renderer is used without it
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    # Renders plain dict/list/str/int/bool/None payloads (see api/lean.py) with
+    # orjson. The bytes match JSONRenderer's compact, unicode output; anything
+    # orjson would encode differently is handed back to JSONRenderer.
+    ORJSON_OPTIONS = (
+        (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS)
+        if orjson else 0
+    )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, option=self.ORJSON_OPTIONS)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # JSONRenderer escapes these two so the output is also valid JavaScript.
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+def stream_json(items, batch_size=200, renderer=None):
+    # Yields a JSON array of `items` in pieces. Each batch is rendered as a list
+    # and its brackets are dropped, so the joined bytes are exactly what the
+    # renderer would have produced for list(items) in one go.
+    renderer = renderer or FastJSONRenderer()
+    batch, prefix = [], b'['
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield prefix + renderer.render(batch)[1:-1]
+            batch, prefix = [], b','
+    if batch:
+        yield prefix + renderer.render(batch)[1:-1] + b']'
+    else:
+        yield b'[]' if prefix == b'[' else b']'
@@ -0,0 +1,70 @@
+# retention.py
+#
+# Keeps the live Order and Cart tables small. Old delivered orders move to
+# ArchivedOrder, with their product ids inlined, and abandoned carts are
+# deleted. Both run in small batches, each in its own short transaction, so
+# writers are never blocked for long. Orders flagged with an AdminOrder stay
+# live, since deleting them would drop the flag (and the order) from
+# /api/admin/orders/.
+
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import analytics
+from .lean import group_pairs
+from .models import ArchivedOrder, Cart, Order
+
+
+def archive_orders(days, batch_size=500):
+    # Moves DELIVERED orders created more than `days` days ago, other than
+    # admin orders, into ArchivedOrder. The sales rollups keep counting them.
+    # Returns the number of orders moved.
+    cutoff = timezone.now() - timedelta(days=days)
+    eligible = Order.objects.filter(
+        status='DELIVERED', created_at__lt=cutoff, adminorder__isnull=True,
+    ).order_by('pk')
+    through = Order.products.through
+    moved = 0
+    while True:
+        with transaction.atomic():
+            rows = list(eligible.values_list('pk', 'user_id', 'total_price', 'status', 'created_at', 'version')[:batch_size])
+            if not rows:
+                break
+            ids = [row[0] for row in rows]
+            products = group_pairs(
+                through.objects.filter(order_id__in=ids).order_by('order_id', 'product_id'), 'order_id', 'product_id',
+            )
+            ArchivedOrder.objects.bulk_create(
+                [
+                    ArchivedOrder(
+                        id=pk, user_id=user_id, total_price=total_price, status=order_status,
+                        created_at=created_at, version=version, product_ids=products.get(pk, []),
+                    )
+                    for pk, user_id, total_price, order_status, created_at, version in rows
+                ],
+                ignore_conflicts=True,
+            )
+            with analytics.rollups_paused():
+                Order.objects.filter(pk__in=ids).delete()
+        moved += len(rows)
+    return moved
+
+
+def purge_abandoned_carts(days, batch_size=500):
+    # Deletes carts (and their items) untouched for `days` days. Returns the
+    # number of carts deleted.
+    cutoff = timezone.now() - timedelta(days=days)
+    abandoned = Cart.objects.filter(updated_at__lt=cutoff)
+    deleted = 0
+    while True:
+        ids = list(abandoned.order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            break
+        # delete() collects the carts again with the cutoff filter, so a cart
+        # touched since the ids were read survives. One touched between that
+        # collection and the DELETE itself (which goes by pk) is still removed.
+        abandoned.filter(pk__in=ids).delete()
+        deleted += len(ids)
+    return deleted
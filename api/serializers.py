@@ -1,10 +1,25 @@
 # serializers.py
 
+from decimal import Decimal
+
 from rest_framework import serializers
 from .models import *
 from django.contrib.auth.models import User
 
 
+class CurrencyMixin:
+    # Shows money_fields in context['currency'] (a currency.Currency) when set.
+    # The view resolves the currency once, so a list only pays the conversion.
+    money_fields = ()
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        currency = self.context.get('currency')
+        if currency is not None:
+            for name in self.money_fields:
+                data[name] = currency.to_string(data[name])
+        return data
+
 class UserProfileSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserProfile
@@ -15,26 +30,63 @@ class ProductImageSerializer(serializers.ModelSerializer):
         model = ProductImage
         fields = ('image',)
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(CurrencyMixin, serializers.ModelSerializer):
+    money_fields = ('price',)
     images = ProductImageSerializer(many=True, read_only=True)
 
     class Meta:
         model = Product
         fields = '__all__'
+        read_only_fields = ('version',)
+
+class BulkProductFilterSerializer(serializers.Serializer):
+    name = serializers.CharField(required=False)
+    is_active = serializers.BooleanField(required=False)
+    is_listed = serializers.BooleanField(required=False)
+    min_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    max_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+
+    def validate(self, data):
+        # An empty filter would match every product
+        if not data:
+            raise serializers.ValidationError("Provide at least one of: " + ", ".join(self.fields) + ".")
+        return data
+
+class BulkProductSerializer(serializers.Serializer):
+    # Which products: an id list or a filter. What to change: any of the rest.
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False, max_length=1000)
+    filter = BulkProductFilterSerializer(required=False)
+    price_percent = serializers.DecimalField(max_digits=6, decimal_places=2, min_value=Decimal('-99.99'), max_value=1000, required=False)
+    is_listed = serializers.BooleanField(required=False)
+    # Within the range of Product.quantity (a 32-bit integer column)
+    quantity_delta = serializers.IntegerField(min_value=-2147483647, max_value=2147483647, required=False)
+
+    def validate(self, data):
+        if ('ids' in data) == ('filter' in data):
+            raise serializers.ValidationError("Provide either ids or filter.")
+        if not {'price_percent', 'is_listed', 'quantity_delta'} & data.keys():
+            raise serializers.ValidationError("Nothing to change: provide price_percent, is_listed or quantity_delta.")
+        return data
+
 # class ProductSerializer(serializers.ModelSerializer):
 #     class Meta:
 #         model = Product
 #         fields = '__all__'
 
-class CartSerializer(serializers.ModelSerializer):
+class CartSerializer(CurrencyMixin, serializers.ModelSerializer):
+    money_fields = ('total_price',)
+
     class Meta:
         model = Cart
         fields = '__all__'
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(CurrencyMixin, serializers.ModelSerializer):
+    money_fields = ('total_price',)
+
     class Meta:
         model = Order
         fields = '__all__'
+        read_only_fields = ('version', 'created_at')
 
 class AdminOrderSerializer(serializers.ModelSerializer):
     class Meta:
@@ -51,6 +103,7 @@ class AddressSerializer(serializers.ModelSerializer):
     class Meta:
         model = Address
         fields = '__all__'
+        read_only_fields = ('user_profile', 'is_default')
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -0,0 +1,74 @@
+# signals.py
+#
+# Keeps the sales rollups (api/analytics.py) in step with Order writes made
+# through the ORM, except inside analytics.rollups_paused(). QuerySet.update()
+# bypasses these; callers using it on orders report the change to analytics
+# themselves. Also invalidates the product cache (api/product_cache.py) on
+# product and image writes; QuerySet.update()/bulk_update() callers on
+# products invalidate it themselves.
+
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import analytics, product_cache
+from .models import Order, Product, ProductImage
+
+OrderProducts = Order.products.through
+
+
+@receiver(pre_save, sender=Order)
+def remember_saved_order(sender, instance, raw, **kwargs):
+    instance._rollup_before = None
+    if instance.pk and not raw and not analytics.is_paused():
+        instance._rollup_before = (
+            Order.objects.filter(pk=instance.pk).values_list('status', 'total_price', 'created_at').first()
+        )
+
+
+@receiver(post_save, sender=Order)
+def roll_up_order(sender, instance, created, raw, **kwargs):
+    if raw or analytics.is_paused():
+        return
+    before = None if created else instance._rollup_before
+    if before is not None and before == (instance.status, instance.total_price, instance.created_at):
+        return
+    analytics.record_order(instance, before=before)
+
+
+@receiver(pre_delete, sender=Order)
+def roll_back_order(sender, instance, **kwargs):
+    if analytics.is_paused():
+        return
+    analytics.record_order(instance, sign=-1)
+    analytics.record_order_products(
+        list(OrderProducts.objects.filter(order_id=instance.pk).values_list('order_id', 'product_id')), sign=-1,
+    )
+
+
+@receiver(m2m_changed, sender=OrderProducts)
+def roll_up_order_products(sender, instance, action, reverse, pk_set, **kwargs):
+    if analytics.is_paused():
+        return
+    if action == 'post_add':
+        pairs = [(pk, instance.pk) if reverse else (instance.pk, pk) for pk in pk_set]
+        analytics.record_order_products(pairs)
+    elif action in ('pre_remove', 'pre_clear'):
+        # Only rows that actually exist are taken out of the rollups
+        rows = OrderProducts.objects.filter(**{'product_id' if reverse else 'order_id': instance.pk})
+        if action == 'pre_remove':
+            rows = rows.filter(**{'order_id__in' if reverse else 'product_id__in': pk_set})
+        instance._rollup_removed = list(rows.values_list('order_id', 'product_id'))
+    elif action in ('post_remove', 'post_clear'):
+        analytics.record_order_products(getattr(instance, '_rollup_removed', []), sign=-1)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_cached_product(sender, instance, **kwargs):
+    product_cache.invalidate()
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def invalidate_cached_product_image(sender, instance, **kwargs):
+    product_cache.invalidate()
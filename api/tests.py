@@ -1,3 +1,740 @@
-from django.test import TestCase
+# tests.py
+#
+# Query regression tests for every named route in api/urls.py.
+#
+# Each route is requested twice, once against a SMALL and once against a
+# LARGE seeded data set (each run in its own rolled-back transaction). The
+# number of queries must not grow with the data. Every SELECT/UPDATE/DELETE
+# is run through EXPLAIN QUERY PLAN, and full table scans of the seeded tables
+# are listed. Query count, plans and full scans are compared against the
+# snapshot in query_baselines.json; any difference fails.
+#
+# After an intended change, regenerate the snapshot and review its diff:
+#     UPDATE_QUERY_BASELINES=1 python manage.py test api
+#
+# The test cases after QueryRegressionTests check behaviour that the query
+# snapshot cannot see.
 
-# Create your tests here.
+import gzip
+import json
+import os
+import re
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import analytics, currency, guest_cart, product_cache, profiling, recommendations, retention, warmup
+from .lean import serialize_carts, serialize_orders, serialize_products
+from .middleware import CompressionMiddleware, accepted_encodings
+from .models import (
+    Address, AdminOrder, ArchivedOrder, Cart, CartItem, CurrencyRate, DailyStatusSales, GuestCart, Order, Product,
+    ProductImage, UserProfile,
+)
+from .renderers import FastJSONRenderer, stream_json
+from .serializers import CartSerializer, OrderSerializer, ProductSerializer
+from .urls import urlpatterns
+
+SMALL, LARGE = 3, 15
+BASELINES = Path(__file__).with_name('query_baselines.json')
+UPDATE = bool(os.environ.get('UPDATE_QUERY_BASELINES'))
+
+# Tables that grow with the seeded size; a plain SCAN of one of them is flagged.
+LARGE_TABLES = {
+    model._meta.db_table for model in
+    (Address, AdminOrder, ArchivedOrder, Cart, CartItem, Order, Product, ProductImage, User, UserProfile)
+} | {Order.products.through._meta.db_table}
+EXPLAINED = ('SELECT', 'UPDATE', 'DELETE', 'WITH')
+FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)$')
+
+PASSWORD = 'secret-password'
+ADDRESS = {
+    'address': '1 Main Road', 'phone_number': '9999999999', 'city': 'Kochi', 'district': 'Ernakulam',
+    'state': 'Kerala', 'country': 'India', 'pincode': '682001',
+}
+
+
+def seed(size):
+    # `size` products (two images each), orders, archived orders, addresses and
+    # cart lines for the shopper, plus `size` other users with a cart and an
+    # order each. Returns the objects the cases refer to.
+    password = make_password(PASSWORD)
+    admin = User.objects.create(username='admin', password=password)
+    UserProfile.objects.create(user=admin, is_super_user=True)
+    shopper = User.objects.create(username='shopper', password=password)
+    profile = UserProfile.objects.create(user=shopper)
+    others = User.objects.bulk_create(User(username=f'user-{i}', password=password) for i in range(size))
+    UserProfile.objects.bulk_create(UserProfile(user=user) for user in others)
+
+    products = Product.objects.bulk_create(
+        Product(name=f'Product {i}', price=f'{10 + i}.50', description='', quantity=100) for i in range(size + 1)
+    )
+    ProductImage.objects.bulk_create(
+        ProductImage(product=product, image=f'product_images/{product.pk}-{n}.jpg') for product in products for n in range(2)
+    )
+
+    orders = Order.objects.bulk_create(
+        [Order(user=shopper, total_price='21.00') for _ in range(size)] + [Order(user=user, total_price='10.50') for user in others]
+    )
+    Order.products.through.objects.bulk_create(
+        Order.products.through(order=order, product=products[(i + n) % size])
+        for i, order in enumerate(orders) for n in range(2)
+    )
+    AdminOrder.objects.bulk_create(AdminOrder(order=order) for order in orders)
+    ArchivedOrder.objects.bulk_create(
+        ArchivedOrder(id=orders[-1].pk + 1 + i, user=shopper, total_price='5.00', status='DELIVERED',
+                      created_at=orders[0].created_at, product_ids=[products[0].pk])
+        for i in range(size)
+    )
+
+    carts = Cart.objects.bulk_create([Cart(user=shopper)] + [Cart(user=user) for user in others])
+    CartItem.objects.bulk_create(
+        [CartItem(cart=carts[0], product=product, quantity=2) for product in products[:size]]
+        + [CartItem(cart=cart, product=products[0]) for cart in carts[1:]]
+    )
+    Cart.objects.update_totals()
+
+    Address.objects.bulk_create(
+        Address(user_profile=profile, is_default=i == size - 1, **ADDRESS) for i in range(size)
+    )
+    analytics.rebuild()
+    recommendations.build_full()
+    key, token = guest_cart.new_token()
+    guest_cart.save(key, {product.pk: 1 for product in products[:size]}, 0)
+
+    return SimpleNamespace(
+        admin=admin, shopper=shopper, product=products[0], spare=products[-1], order=orders[0],
+        product_ids=[product.pk for product in products],
+        address=Address.objects.filter(user_profile=profile).order_by('pk').first(), guest=token,
+        refresh=str(RefreshToken.for_user(shopper)),
+    )
+
+
+# (label, route name, method, user, url kwargs, body) per request; label is the
+# snapshot key. Callables receive the seed() namespace.
+CASES = [
+    ('token_obtain_pair', 'token_obtain_pair', 'post', None, {},
+     lambda s: {'username': 'shopper', 'password': PASSWORD}),
+    ('token_refresh', 'token_refresh', 'post', None, {}, lambda s: {'refresh': s.refresh}),
+    ('user-profile', 'user-profile', 'get', 'shopper', {}, None),
+    ('product-list', 'product-list', 'get', None, {}, None),
+    ('product-detail', 'product-detail', 'get', None, {'pk': 'product'}, None),
+    ('product-related', 'product-related', 'get', None, {'pk': 'product'}, None),
+    ('product-batch', 'product-batch', 'get', None, {},
+     lambda s: {'ids': ','.join(str(pk) for pk in s.product_ids + [max(s.product_ids) + 1])}),
+    ('order-list', 'order-list', 'get', 'shopper', {}, None),
+    ('order-list?limit', 'order-list', 'get', 'shopper', {}, lambda s: {'limit': 100}),
+    ('create-order', 'create-order', 'post', 'shopper', {},
+     lambda s: {'user': s.shopper.pk, 'total_price': '21.00', 'products': [s.product.pk, s.spare.pk]}),
+    ('admin-order-list', 'admin-order-list', 'get', 'admin', {}, None),
+    ('admin-analytics-top-products', 'admin-analytics-top-products', 'get', 'admin', {}, None),
+    ('admin-analytics-sales', 'admin-analytics-sales', 'get', 'admin', {}, None),
+    ('register', 'register', 'post', None, {}, lambda s: {'username': 'newcomer', 'password': PASSWORD}),
+    ('delete-order', 'delete-order', 'delete', 'shopper', {'order_id': 'order'}, None),
+    ('change-order-status', 'change-order-status', 'put', 'shopper', {'order_id': 'order'},
+     lambda s: {'status': 'DELIVERED'}),
+    ('cart-checkout', 'cart-checkout', 'post', 'shopper', {}, None),
+    ('buy-now', 'buy-now', 'post', 'shopper', {'product_id': 'product'}, None),
+    ('add-address', 'add-address', 'post', 'shopper', {}, lambda s: ADDRESS),
+    ('edit-address', 'edit-address', 'put', 'shopper', {'address_id': 'address'}, lambda s: {'city': 'Thrissur'}),
+    ('latest-address', 'latest-address', 'get', 'shopper', {}, None),
+    ('address-list', 'address-list', 'get', 'shopper', {}, None),
+    ('set-default-address', 'set-default-address', 'post', 'shopper', {'address_id': 'address'}, None),
+    ('delete-address', 'delete-address', 'delete', 'shopper', {'address_id': 'address'}, None),
+    ('add-to-cart', 'add-to-cart', 'post', 'shopper', {'product_id': 'spare'}, None),
+    ('cart-detail', 'cart-detail', 'get', 'shopper', {}, None),
+    ('add-cart-item', 'add-cart-item', 'post', 'shopper', {'product_id': 'product'}, None),
+    ('minus-cart-item', 'minus-cart-item', 'post', 'shopper', {'product_id': 'product'}, None),
+    ('remove-cart-item', 'remove-cart-item', 'delete', 'shopper', {'product_id': 'product'}, None),
+    ('guest-cart-detail', 'guest-cart-detail', 'get', None, {}, None),
+    ('guest-add-to-cart', 'guest-add-to-cart', 'post', None, {'product_id': 'spare'}, None),
+    ('guest-add-cart-item', 'guest-add-cart-item', 'post', None, {'product_id': 'product'}, None),
+    ('guest-minus-cart-item', 'guest-minus-cart-item', 'post', None, {'product_id': 'product'}, None),
+    ('guest-remove-cart-item', 'guest-remove-cart-item', 'delete', None, {'product_id': 'product'}, None),
+    ('add-product', 'add-product', 'post', 'admin', {},
+     lambda s: {'name': 'New product', 'price': '5.00', 'description': 'New', 'quantity': 1}),
+    ('edit-product', 'edit-product', 'put', 'admin', {'product_id': 'product'}, lambda s: {'price': '12.00'}),
+    ('delete-product', 'delete-product', 'delete', 'admin', {'product_id': 'product'}, None),
+    ('toggle-product-listing', 'toggle-product-listing', 'patch', 'admin', {'product_id': 'product'}, None),
+    ('bulk-products', 'bulk-products', 'post', 'admin', {},
+     lambda s: {'filter': {'name': 'Product'}, 'price_percent': '5'}),
+    ('product-single-image', 'product-single-image', 'get', None, {'product_id': 'product'}, None),
+    ('product-all-images', 'product-all-images', 'get', None, {'product_id': 'product'}, None),
+]
+
+
+def describe(sql):
+    # EXPLAIN QUERY PLAN lines for statements that read or write rows, the
+    # leading keywords for the rest (savepoint names are random, so dropped).
+    words = sql.split()
+    if words[0].upper() not in EXPLAINED:
+        return ' '.join(words[:1] if words[0].upper() in ('SAVEPOINT', 'RELEASE', 'ROLLBACK') else words[:3])
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class QueryRegressionTests(TestCase):
+    baselines = {}
+    snapshots = {}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        if BASELINES.exists():
+            cls.baselines = json.loads(BASELINES.read_text())
+
+    @classmethod
+    def tearDownClass(cls):
+        if UPDATE and cls.snapshots:
+            BASELINES.write_text(json.dumps(dict(sorted(cls.snapshots.items())), indent=2) + '\n')
+        super().tearDownClass()
+
+    def run_case(self, size, case):
+        # (number of queries, [statement descriptions]) for one request.
+        _, name, method, user, kwargs, body = case
+        product_cache.clear()
+        with transaction.atomic():
+            seeded = seed(size)
+            headers = {'HTTP_X_GUEST_CART': seeded.guest}
+            if user:
+                headers['HTTP_AUTHORIZATION'] = f'Bearer {RefreshToken.for_user(getattr(seeded, user)).access_token}'
+            url = reverse(name, kwargs={key: getattr(seeded, attr).pk for key, attr in kwargs.items()})
+            data = body(seeded) if body else None
+            send = getattr(self.client, method)
+            with CaptureQueriesContext(connection) as queries:
+                if method == 'get':
+                    response = send(url, data, **headers)
+                else:
+                    response = send(url, data, content_type='application/json', **headers)
+                content = b''.join(response.streaming_content) if response.streaming else response.content
+            self.assertLess(response.status_code, 400, f'{case[0]}: {response.status_code} {content[:200]}')
+            statements = [describe(query['sql']) for query in queries.captured_queries]
+            transaction.set_rollback(True)
+        return len(statements), statements
+
+    def test_every_route_has_a_case(self):
+        named = {pattern.name for pattern in urlpatterns if isinstance(pattern, URLPattern) and pattern.name}
+        self.assertEqual(named - {case[1] for case in CASES}, set())
+
+    def test_query_counts_and_plans(self):
+        for case in CASES:
+            label = case[0]
+            with self.subTest(route=label):
+                small, _ = self.run_case(SMALL, case)
+                large, statements = self.run_case(LARGE, case)
+                self.assertEqual(small, large, f'{label}: {small} queries for {SMALL} rows, {large} for {LARGE}')
+                scans = sorted({
+                    match.group(1) for plan in statements if isinstance(plan, list) for line in plan
+                    for match in [FULL_SCAN.match(line)] if match and match.group(1) in LARGE_TABLES
+                })
+                snapshot = {'queries': large, 'full_scans': scans, 'statements': statements}
+                self.snapshots[label] = snapshot
+                if UPDATE:
+                    continue
+                baseline = self.baselines.get(label)
+                self.assertIsNotNone(baseline, f'{label}: no baseline, run with UPDATE_QUERY_BASELINES=1')
+                new_scans = sorted(set(scans) - set(baseline['full_scans']))
+                self.assertEqual(new_scans, [], f'{label}: new full table scans')
+                self.assertEqual(snapshot, baseline, f'{label}: queries or plans differ from query_baselines.json')
+
+
+class CurrencyRateTests(TestCase):
+    def test_rate_written_by_another_process_is_picked_up(self):
+        CurrencyRate.objects.create(code='USD', rate='0.0120')
+        product = Product.objects.create(name='Lamp', price='100.00', description='A lamp', quantity=1)
+        url = reverse('product-detail', kwargs={'pk': product.pk})
+        self.assertEqual(self.client.get(url, {'currency': 'USD'}).json()['price'], '1.20')
+
+        # Written the way another worker would: nothing in this process is told
+        CurrencyRate.objects.filter(code='USD').update(rate='0.0150', updated_at=timezone.now())
+        self.assertEqual(self.client.get(url, {'currency': 'USD'}).json()['price'], '1.50')
+
+        CurrencyRate.objects.filter(code='USD').delete()
+        self.assertEqual(self.client.get(url, {'currency': 'USD'}).status_code, 406)
+
+
+class GuestCartTests(TestCase):
+    def setUp(self):
+        self.lamp = Product.objects.create(name='Lamp', price='100.00', description='A lamp', quantity=10)
+        self.rug = Product.objects.create(name='Rug', price='40.50', description='A rug', quantity=10)
+
+    def test_login_merges_guest_cart_into_existing_cart(self):
+        user = User.objects.create_user(username='shopper', password=PASSWORD)
+        UserProfile.objects.create(user=user)
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=cart, product=self.lamp, quantity=2)
+
+        token = self.client.post(reverse('guest-add-to-cart', kwargs={'product_id': self.lamp.pk})).json()['token']
+        headers = {'HTTP_X_GUEST_CART': token}
+        self.client.post(reverse('guest-add-cart-item', kwargs={'product_id': self.lamp.pk}), **headers)
+        guest = self.client.post(reverse('guest-add-to-cart', kwargs={'product_id': self.rug.pk}), **headers).json()
+        self.assertEqual(guest['total_count'], 3)
+
+        response = self.client.post(reverse('token_obtain_pair'), {'username': 'shopper', 'password': PASSWORD}, **headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            dict(CartItem.objects.filter(cart=cart).values_list('product_id', 'quantity')), {self.lamp.pk: 4, self.rug.pk: 1},
+        )
+        cart.refresh_from_db()
+        self.assertEqual(str(cart.total_price), '440.50')
+        self.assertFalse(GuestCart.objects.exists())
+
+    def test_non_object_body_starts_a_new_cart(self):
+        for body in ([1], {'guest_cart': 5}):
+            url = reverse('guest-add-to-cart', kwargs={'product_id': self.lamp.pk})
+            response = self.client.post(url, body, content_type='application/json')
+            self.assertEqual((response.status_code, response.json()['total_count']), (201, 1))
+
+    def test_stale_write_is_retried_not_lost(self):
+        key, token = guest_cart.new_token()
+        self.assertTrue(guest_cart.save(key, {self.lamp.pk: 1}, 0))
+        items, version = guest_cart.load(key)
+        # Another worker saves the cart after this one read it
+        self.assertTrue(guest_cart.save(key, {self.lamp.pk: 1, self.rug.pk: 1}, version))
+        self.assertFalse(guest_cart.save(key, {self.lamp.pk: 2}, version))
+
+        guest_cart.change(key, lambda items: items.update({self.lamp.pk: items[self.lamp.pk] + 1}))
+        self.assertEqual(guest_cart.load(key), ({self.lamp.pk: 2, self.rug.pk: 1}, 3))
+
+
+class ProductBatchTests(TestCase):
+    def setUp(self):
+        product_cache.clear()
+        self.admin = User.objects.create_user(username='admin', password=PASSWORD)
+        UserProfile.objects.create(user=self.admin, is_super_user=True)
+        self.lamp = Product.objects.create(name='Lamp', price='100.00', description='A lamp', quantity=10)
+        self.rug = Product.objects.create(name='Rug', price='40.50', description='A rug', quantity=10)
+        ProductImage.objects.create(product=self.rug, image='product_images/rug.jpg')
+
+    def batch(self, *ids):
+        return self.client.get(reverse('product-batch'), {'ids': ','.join(map(str, ids))}).json()
+
+    def test_order_and_missing_ids(self):
+        absent = self.rug.pk + 100
+        body = self.batch(self.rug.pk, absent, self.lamp.pk, self.rug.pk)
+        self.assertEqual([item['id'] for item in body['results']], [self.rug.pk, self.lamp.pk])
+        self.assertEqual(body['missing'], [absent])
+        self.assertEqual(body['results'][0]['image'], 'http://testserver/product_images/rug.jpg')
+        self.assertIsNone(body['results'][1]['image'])
+
+        # Cached as missing until the product is created
+        Product.objects.create(id=absent, name='Vase', price='9.99', description='A vase', quantity=1)
+        body = self.batch(absent)
+        self.assertEqual((body['results'][0]['name'], body['missing']), ('Vase', []))
+
+    def test_invalid_ids(self):
+        for ids in ('', 'one', '99999999999999999999999', ','.join(map(str, range(1, 302)))):
+            response = self.client.get(reverse('product-batch'), {'ids': ids})
+            self.assertEqual(response.status_code, 400, ids[:30])
+
+    def test_edit_invalidates_cached_entry(self):
+        self.assertEqual(self.batch(self.lamp.pk)['results'][0]['price'], '100.00')
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(self.admin).access_token}'}
+        response = self.client.put(
+            reverse('edit-product', kwargs={'product_id': self.lamp.pk}), {'price': '120.00'},
+            content_type='application/json', **headers,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.batch(self.lamp.pk)['results'][0]['price'], '120.00')
+
+    def test_write_from_another_process_is_picked_up(self):
+        self.assertEqual(self.batch(self.lamp.pk)['results'][0]['name'], 'Lamp')
+        # Another worker's write reaches this one only through the database
+        Product.objects.filter(pk=self.lamp.pk).update(name='Desk lamp')
+        product_cache.invalidate()
+        self.assertEqual(self.batch(self.lamp.pk)['results'][0]['name'], 'Desk lamp')
+
+
+class ConditionalUpdateTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username='admin', password=PASSWORD)
+        UserProfile.objects.create(user=self.admin, is_super_user=True)
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(self.admin).access_token}'}
+        self.lamp = Product.objects.create(name='Lamp', price='100.00', description='A lamp', quantity=10)
+
+    def edit(self, if_match=None, price='120.00'):
+        headers = dict(self.auth, HTTP_IF_MATCH=if_match) if if_match else self.auth
+        return self.client.put(
+            reverse('edit-product', kwargs={'product_id': self.lamp.pk}), {'price': price},
+            content_type='application/json', **headers,
+        )
+
+    def test_product_edit(self):
+        response = self.client.get(reverse('product-detail', kwargs={'pk': self.lamp.pk}))
+        self.assertEqual(response['ETag'], '"1"')
+        for tag in ('"garbage"', '"7"', 'W/"0"', '"-1"', f'"{2 ** 64}"'):
+            self.assertEqual(self.edit(tag, price='1.00').status_code, 412, tag)
+        self.lamp.refresh_from_db()
+        self.assertEqual((str(self.lamp.price), self.lamp.version), ('100.00', 1))
+
+        response = self.edit('"1"')
+        self.assertEqual((response.status_code, response['ETag'], response.json()['price']), (200, '"2"', '120.00'))
+        self.assertEqual(self.edit('"1"').status_code, 412)
+        self.assertEqual(self.edit(price='130.00')['ETag'], '"3"')
+
+    def test_orm_save_bumps_version(self):
+        self.lamp.price = '110.00'
+        self.lamp.save()  # as the Django admin does
+        self.assertEqual(Product.objects.get().version, 2)
+        self.lamp.save(update_fields=['price'])
+        self.assertEqual(Product.objects.get().version, 3)
+        self.assertEqual(self.edit('"1"').status_code, 412)
+        self.assertEqual(self.edit('"3"').status_code, 200)
+
+    def test_toggle_listing(self):
+        url = reverse('toggle-product-listing', kwargs={'product_id': self.lamp.pk})
+        for tag in ('"nope"', f'"{2 ** 64}"'):
+            self.assertEqual(self.client.patch(url, HTTP_IF_MATCH=tag, **self.auth).status_code, 412)
+        response = self.client.patch(url, HTTP_IF_MATCH='"1"', **self.auth)
+        self.assertEqual((response.status_code, response['ETag'], response.json()['is_listed']), (200, '"2"', False))
+        self.assertEqual(self.client.patch(url, HTTP_IF_MATCH='"1"', **self.auth).status_code, 412)
+
+    def test_order_status_keeps_rollups_consistent(self):
+        order = Order.objects.create(user=self.admin, total_price='50.00')
+        url = reverse('change-order-status', kwargs={'order_id': order.pk})
+        send = lambda tag: self.client.put(
+            url, {'status': 'DELIVERED'}, content_type='application/json', HTTP_IF_MATCH=tag, **self.auth,
+        )
+        self.assertEqual(send('"garbage"').status_code, 412)
+        self.assertEqual(send(f'"{2 ** 64}"').status_code, 412)
+        # Another request moved the order on after this one read it
+        Order.objects.filter(pk=order.pk).update(status='DELIVERED', version=2)
+        analytics.rebuild()
+        Order.objects.filter(pk=order.pk).update(status='CONFIRMED', version=3)
+        analytics.rebuild()
+
+        self.assertEqual(send('"2"').status_code, 412)
+        response = send('"3"')
+        self.assertEqual((response.status_code, response['ETag'], response.json()['status']), (200, '"4"', 'DELIVERED'))
+        rollups = lambda: list(
+            DailyStatusSales.objects.exclude(orders=0).order_by('day', 'status').values_list('status', 'orders', 'revenue')
+        )
+        recorded = rollups()
+        analytics.rebuild()
+        self.assertEqual(recorded, rollups())
+
+
+class BulkProductTests(TestCase):
+    def setUp(self):
+        admin = User.objects.create_user(username='admin', password=PASSWORD)
+        UserProfile.objects.create(user=admin, is_super_user=True)
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(admin).access_token}'}
+        self.cheap = Product.objects.create(name='Lamp', price='100.00', description='A lamp', quantity=10)
+        self.dear = Product.objects.create(name='Piano', price='90000000.00', description='A piano', quantity=1)
+
+    def bulk(self, body):
+        return self.client.post(reverse('bulk-products'), body, content_type='application/json', **self.auth)
+
+    def test_empty_filter_is_rejected(self):
+        response = self.bulk({'filter': {}, 'is_listed': False})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Product.objects.filter(is_listed=False).exists())
+
+    def test_quantity_delta_is_bounded(self):
+        response = self.bulk({'ids': [self.cheap.pk], 'quantity_delta': 10 ** 20})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('quantity_delta', response.json())
+        self.assertEqual(self.bulk({'ids': [self.cheap.pk], 'quantity_delta': -50}).status_code, 200)
+        self.cheap.refresh_from_db()
+        self.assertEqual(self.cheap.quantity, 0)
+
+    def test_price_overflow_is_rejected_without_writing(self):
+        response = self.bulk({'filter': {'min_price': '1.00'}, 'price_percent': '20'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            dict(Product.objects.values_list('pk', 'price')),
+            {self.cheap.pk: Decimal('100.00'), self.dear.pk: Decimal('90000000.00')},
+        )
+
+        response = self.bulk({'ids': [self.cheap.pk], 'price_percent': '20'})
+        self.assertEqual(response.json(), {'products_updated': 1, 'carts_updated': 0})
+        self.cheap.refresh_from_db()
+        self.assertEqual(self.cheap.price, Decimal('120.00'))
+
+
+class OrderHistoryTests(TestCase):
+    def test_archived_orders_follow_live_ones(self):
+        user = User.objects.create_user(username='shopper', password=PASSWORD)
+        lamp = Product.objects.create(name='Lamp', price='100.00', description='A lamp', quantity=10)
+        old = Order.objects.create(user=user, total_price='100.00', status='DELIVERED')
+        old.products.add(lamp)
+        Order.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=400))
+        self.assertEqual(retention.archive_orders(days=365), 1)
+
+        url = reverse('order-list')
+        auth = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(user).access_token}'}
+        orders = json.loads(b''.join(self.client.get(url, **auth).streaming_content))
+        self.assertEqual([(order['id'], order['products']) for order in orders], [(old.pk, [lamp.pk])])
+
+        live = Order.objects.create(user=user, total_price='100.00')
+        orders = json.loads(b''.join(self.client.get(url, **auth).streaming_content))
+        self.assertEqual([order['id'] for order in orders], [live.pk, old.pk])
+        # Same rows as the paged history, which runs newest first
+        self.assertEqual(orders, self.client.get(url, {'limit': 10}, **auth).json())
+        page = self.client.get(url, {'limit': 10, 'before': 10 ** 30}, **auth)
+        self.assertEqual((page.status_code, [order['id'] for order in page.json()]), (200, [live.pk, old.pk]))
+
+    def test_admin_orders_are_not_archived(self):
+        admin = User.objects.create_user(username='admin', password=PASSWORD)
+        UserProfile.objects.create(user=admin, is_super_user=True)
+        flagged, plain = Order.objects.bulk_create(
+            Order(user=admin, total_price='10.00', status='DELIVERED', created_at=timezone.now() - timedelta(days=400))
+            for _ in range(2)
+        )
+        AdminOrder.objects.create(order=flagged)
+        self.assertEqual(retention.archive_orders(days=365), 1)
+        self.assertEqual(list(ArchivedOrder.objects.values_list('pk', flat=True)), [plain.pk])
+
+        auth = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(admin).access_token}'}
+        listed = self.client.get(reverse('admin-order-list'), **auth).json()['results']
+        self.assertEqual([row['order'] for row in listed], [flagged.pk])
+
+
+class AnalyticsTests(TestCase):
+    def test_days_is_clamped(self):
+        admin = User.objects.create_user(username='admin', password=PASSWORD)
+        UserProfile.objects.create(user=admin, is_super_user=True)
+        auth = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(admin).access_token}'}
+        Order.objects.create(user=admin, total_price='10.00')
+        for name in ('admin-analytics-sales', 'admin-analytics-top-products'):
+            response = self.client.get(reverse(name), {'days': 1000000}, **auth)
+            self.assertEqual(response.status_code, 200, name)
+        self.assertEqual(self.client.get(reverse('admin-analytics-sales'), {'days': 1000000}, **auth).json()[0]['orders'], 1)
+
+    def test_order_date_is_not_client_writable(self):
+        user = User.objects.create_user(username='shopper', password=PASSWORD)
+        lamp = Product.objects.create(name='Lamp', price='10.00', description='A lamp', quantity=10)
+        auth = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(user).access_token}'}
+        body = {'user': user.pk, 'total_price': '10.00', 'products': [lamp.pk], 'created_at': '2020-01-01T00:00:00Z'}
+        response = self.client.post(reverse('create-order'), body, content_type='application/json', **auth)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Order.objects.get().created_at.date(), timezone.localdate())
+        self.assertEqual(list(DailyStatusSales.objects.values_list('day', flat=True)), [timezone.localdate()])
+
+
+class RecommendationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='shopper', password=PASSWORD)
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(self.user).access_token}'}
+        self.lamp = Product.objects.create(name='Lamp', price='100.00', description='A lamp', quantity=10)
+        self.rug = Product.objects.create(name='Rug', price='40.50', description='A rug', quantity=10)
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.bulk_create([CartItem(cart=cart, product=self.lamp), CartItem(cart=cart, product=self.rug)])
+        cart.refresh_total()
+
+    def test_checkout_basket_is_counted(self):
+        recommendations.build_full()
+        self.assertEqual(self.client.post(reverse('cart-checkout'), **self.auth).status_code, 201)
+        recommendations.build_incremental()
+        self.assertEqual([row[0] for row in recommendations.related(self.lamp.pk)], [self.rug.pk])
+
+    def test_checkout_is_one_transaction(self):
+        # A failure after the order is created leaves no order without products
+        with mock.patch.object(Cart, 'delete', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.client.post(reverse('cart-checkout'), **self.auth)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(CartItem.objects.count(), 2)
+
+
+class CartTests(TestCase):
+    def test_removing_an_item_updates_the_total(self):
+        user = User.objects.create_user(username='shopper', password=PASSWORD)
+        auth = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(user).access_token}'}
+        lamp = Product.objects.create(name='Lamp', price='100.00', description='A lamp', quantity=10)
+        rug = Product.objects.create(name='Rug', price='40.50', description='A rug', quantity=10)
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.bulk_create([CartItem(cart=cart, product=lamp, quantity=2), CartItem(cart=cart, product=rug)])
+        cart.refresh_total()
+
+        url = reverse('remove-cart-item', kwargs={'product_id': lamp.pk})
+        self.assertEqual(self.client.delete(url, **auth).json()['total_price'], '40.50')
+        self.assertEqual(self.client.delete(url, **auth).status_code, 400)
+        url = reverse('remove-cart-item', kwargs={'product_id': rug.pk})
+        self.assertEqual(self.client.delete(url, **auth).json()['total_price'], '0.00')
+
+
+class WarmupTests(TestCase):
+    def test_database_step_only_reads(self):
+        ContentType.objects.filter(app_label='api', model='guestcart').delete()
+        ContentType.objects.clear_cache()
+        count = ContentType.objects.count()
+        self.assertIn('database', warmup.warm_up(connect=True))
+        self.assertEqual(ContentType.objects.count(), count)
+        with self.assertNumQueries(0):
+            ContentType.objects.get_for_model(Product)
+
+
+class LeanSerializerTests(TestCase):
+    # api/lean.py must render byte for byte what the DRF serializers render.
+    @classmethod
+    def setUpTestData(cls):
+        users = [User.objects.create_user(username=f'user-{i}') for i in range(3)]
+        products = [
+            Product.objects.create(name='Lamp', price='100.00', description='A lamp', quantity=10),
+            Product.objects.create(name='Café table \u2028', price='7.05', description='Ünïcode', quantity=0, is_listed=False),
+            Product.objects.create(name='Rug', price='1234567.89', description='', quantity=3, is_active=False),
+        ]
+        ProductImage.objects.create(product=products[0], image='product_images/lamp-1.jpg')
+        ProductImage.objects.create(product=products[0], image='product_images/lamp 2.jpg')
+        ProductImage.objects.create(product=products[2], image='product_images/rug.jpg')
+        orders = [Order.objects.create(user=user, total_price='107.05') for user in users]
+        orders[0].products.add(*products)
+        orders[1].products.add(products[1])
+        Order.objects.filter(pk=orders[2].pk).update(status='DELIVERED')
+        for user, items in zip(users, ([products[0], products[1]], [products[2]], [])):
+            cart = Cart.objects.create(user=user)
+            for product in items:
+                CartItem.objects.create(cart=cart, product=product, quantity=2)
+
+    def assert_same_bytes(self, serializer_class, lean, queryset, context, **kwargs):
+        expected = JSONRenderer().render(serializer_class(queryset, many=True, context=context).data)
+        data = lean(queryset, **kwargs)
+        self.assertEqual(JSONRenderer().render(data), expected)
+        self.assertEqual(FastJSONRenderer().render(data), expected)
+
+    def test_products(self):
+        products = Product.objects.order_by('pk')
+        request = APIRequestFactory().get('/api/products/')
+        usd = currency.Currency('USD', Decimal('0.01234567'), 2)
+        self.assert_same_bytes(ProductSerializer, serialize_products, products, {})
+        self.assert_same_bytes(ProductSerializer, serialize_products, products, {'request': request}, request=request)
+        self.assert_same_bytes(
+            ProductSerializer, serialize_products, products, {'request': request, 'currency': usd},
+            request=request, currency=usd,
+        )
+
+    def test_orders(self):
+        orders = Order.objects.order_by('pk')
+        jpy = currency.Currency('JPY', Decimal('1.7812'), 0)
+        self.assert_same_bytes(OrderSerializer, serialize_orders, orders, {})
+        self.assert_same_bytes(OrderSerializer, serialize_orders, orders, {'currency': jpy}, currency=jpy)
+
+    def test_carts(self):
+        carts = Cart.objects.order_by('pk')
+        usd = currency.Currency('USD', Decimal('0.01234567'), 2)
+        self.assert_same_bytes(CartSerializer, serialize_carts, carts, {})
+        self.assert_same_bytes(CartSerializer, serialize_carts, carts, {'currency': usd}, currency=usd)
+
+
+class CompressionTests(TestCase):
+    def compress(self, response, accept='gzip'):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING=accept)
+        return CompressionMiddleware(lambda request: response).process_response(request, response)
+
+    def json_response(self, size):
+        body = JSONRenderer().render([{'id': i, 'name': 'Lamp'} for i in range(size)])
+        return HttpResponse(body, content_type='application/json'), body
+
+    def test_accepted_encodings(self):
+        self.assertEqual(accepted_encodings('gzip, deflate, br'), {'gzip', 'deflate', 'br'})
+        self.assertEqual(accepted_encodings('br;q=0, GZIP;q=0.5'), {'gzip'})
+        self.assertEqual(accepted_encodings('gzip; q=0.000, identity'), {'identity'})
+
+    def test_q0_gzip_is_not_used(self):
+        response, body = self.json_response(200)
+        response = self.compress(response, 'gzip;q=0, identity')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content, body)
+
+    def test_size_threshold(self):
+        small = HttpResponse(b'[' + b'1,' * 400 + b'1]', content_type='application/json')
+        self.assertLess(len(small.content), settings.COMPRESSION_MIN_SIZE)
+        self.assertFalse(self.compress(small).has_header('Content-Encoding'))
+
+        response, body = self.json_response(200)
+        self.assertGreaterEqual(len(body), settings.COMPRESSION_MIN_SIZE)
+        response = self.compress(response)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Length'], str(len(response.content)))
+        self.assertEqual(gzip.decompress(response.content), body)
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_etag_becomes_weak(self):
+        response, _ = self.json_response(200)
+        response['ETag'] = '"3"'
+        self.assertEqual(self.compress(response)['ETag'], 'W/"3"')
+        response, _ = self.json_response(200)
+        response['ETag'] = '"3"'
+        self.assertEqual(self.compress(response, 'identity')['ETag'], '"3"')
+
+    def test_streamed_gzip_matches_buffered_body(self):
+        items = [{'id': i, 'name': f'Product {i}', 'price': f'{i}.50'} for i in range(1000)]
+        buffered = JSONRenderer().render(items)
+        response = self.compress(StreamingHttpResponse(stream_json(iter(items)), content_type='application/json'))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertFalse(response.has_header('Content-Length'))
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), buffered)
+
+
+class StreamJSONTests(TestCase):
+    def render(self, items, batch_size):
+        return b''.join(stream_json(iter(items), batch_size=batch_size))
+
+    def test_empty(self):
+        self.assertEqual(self.render([], 3), b'[]')
+
+    def test_batch_boundaries(self):
+        for count in (1, 2, 3, 4, 6, 7):
+            items = [{'id': i, 'name': 'Café \u2028'} for i in range(count)]
+            self.assertEqual(self.render(items, 3), JSONRenderer().render(items), count)
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        settings_override = override_settings(PROFILE_DIR=self.directory, PROFILE_SAMPLE_RATE=0.0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.lamp = Product.objects.create(name='Lamp', price='100.00', description='A lamp', quantity=1)
+
+    def get(self, token):
+        return self.client.get(reverse('product-detail', kwargs={'pk': self.lamp.pk}), HTTP_X_PROFILE=token)
+
+    def test_bad_or_expired_token_is_not_profiled(self):
+        with mock.patch('django.core.signing.time.time', return_value=time.time() - settings.PROFILE_TOKEN_MAX_AGE - 60):
+            expired = profiling.new_token()
+        for token in ('profile', profiling.new_token() + 'x', expired):
+            response = self.get(token)
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(response.has_header('X-Profile'), token)
+        self.assertEqual(list(self.directory.iterdir()), [])
+
+    def test_profile_is_written_and_read_back(self):
+        response = self.get(profiling.new_token())
+        name = response['X-Profile']
+        self.assertTrue(name.endswith(profiling.SUFFIX))
+        self.assertEqual([path.name for path in self.directory.iterdir()], [name])
+
+        [(url_name, (count, stacks, queries))] = profiling.read(self.directory).items()
+        self.assertEqual((url_name, count), ('product-detail', 1))
+        self.assertTrue(any(statement.startswith('SELECT "api_product".') for statement in queries))
+        self.assertIn('FROM "api_productimage"', ' '.join(queries))
+        self.assertTrue(all(calls >= 1 and seconds >= 0 for calls, seconds in queries.values()))
+        self.assertTrue(all(stack and samples > 0 for stack, samples in stacks.items()))
+
+    def test_only_newest_profiles_are_kept(self):
+        with override_settings(PROFILE_MAX_FILES=2):
+            names = [self.get(profiling.new_token())['X-Profile'] for _ in range(4)]
+        self.assertEqual(sorted(path.name for path in self.directory.glob(f'*{profiling.SUFFIX}')), names[2:])
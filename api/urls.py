@@ -2,17 +2,21 @@
 
 from django.urls import path
 from .views import *
-from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from rest_framework_simplejwt.views import TokenRefreshView
 
 urlpatterns = [
-    path('login/', TokenObtainPairView.as_view(), name='token_obtain_pair'),#Tested
+    path('login/', LoginView.as_view(), name='token_obtain_pair'),#Tested
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),#Tested
     path('user/profile/', UserProfileView.as_view(), name='user-profile'),#Tested
     path('products/', ProductListView.as_view(), name='product-list'),#Tested
     path('products/<int:pk>/', ProductDetailView.as_view(), name='product-detail'),#Tested
+    path('products/batch/', ProductBatchView.as_view(), name='product-batch'),
+    path('products/<int:pk>/related/', RelatedProductsView.as_view(), name='product-related'),
     path('orders/', OrderView.as_view(), name='order-list'),#Tested
     path('orders/create/', CreateOrderView.as_view(), name='create-order'),#Tested
     path('admin/orders/', AdminOrderView.as_view(), name='admin-order-list'),
+    path('admin/analytics/top-products/', AdminTopProductsView.as_view(), name='admin-analytics-top-products'),
+    path('admin/analytics/sales/', AdminSalesSeriesView.as_view(), name='admin-analytics-sales'),
     path('register/', RegisterView.as_view(), name='register'),#Tested
     path('orders/<int:order_id>/delete/', DeleteOrderView.as_view(), name='delete-order'),#Tested
     path('orders/<int:order_id>/change-status/', ChangeOrderStatusView.as_view(), name='change-order-status'),#Tested
@@ -21,15 +25,24 @@ urlpatterns = [
     path('add-address/', AddAddressView.as_view(), name='add-address'),#Tested
     path('address/edit/<int:address_id>/', EditAddressView.as_view(), name='edit-address'),#Tested
     path('address/', GetAddressView.as_view(), name='latest-address'),#Tested
+    path('address/all/', AddressListView.as_view(), name='address-list'),
+    path('address/<int:address_id>/default/', SetDefaultAddressView.as_view(), name='set-default-address'),
+    path('address/delete/<int:address_id>/', DeleteAddressView.as_view(), name='delete-address'),
     path('cart/add/<int:product_id>/', AddToCartView.as_view(), name='add-to-cart'),#Tested
     path('cart/detail/', CartDetailView.as_view(), name='cart-detail'),#Tested
     path('cart/update/<int:product_id>/add/', UpdateCartItemView.as_view(), {'action': 'add'}, name='add-cart-item'),
     path('cart/update/<int:product_id>/minus/', UpdateCartItemView.as_view(), {'action': 'minus'}, name='minus-cart-item'),
     path('cart/remove/<int:product_id>/', RemoveCartItemView.as_view(), name='remove-cart-item'),
+    path('guest-cart/', GuestCartDetailView.as_view(), name='guest-cart-detail'),
+    path('guest-cart/add/<int:product_id>/', GuestAddToCartView.as_view(), name='guest-add-to-cart'),
+    path('guest-cart/update/<int:product_id>/add/', GuestUpdateCartItemView.as_view(), {'action': 'add'}, name='guest-add-cart-item'),
+    path('guest-cart/update/<int:product_id>/minus/', GuestUpdateCartItemView.as_view(), {'action': 'minus'}, name='guest-minus-cart-item'),
+    path('guest-cart/remove/<int:product_id>/', GuestRemoveCartItemView.as_view(), name='guest-remove-cart-item'),
     path('products/add/', AddProductView.as_view(), name='add-product'),
     path('products/edit/<int:product_id>/', EditProductView.as_view(), name='edit-product'),
     path('products/delete/<int:product_id>/', DeleteProductView.as_view(), name='delete-product'),
     path('products/toggle-listing/<int:product_id>/', ToggleProductListingView.as_view(), name='toggle-product-listing'),
+    path('products/bulk/', BulkProductView.as_view(), name='bulk-products'),
     path('product/<int:product_id>/image/single/', ProductSingleImageView.as_view(), name='product-single-image'),
     path('product/<int:product_id>/image/all/', ProductAllImagesView.as_view(), name='product-all-images'),
 ]
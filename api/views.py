@@ -1,6 +1,6 @@
 # views.py
 
-from django.http import Http404
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -10,10 +10,61 @@ from .models import *
 from .serializers import *
 from rest_framework.pagination import PageNumberPagination
 from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework.permissions import AllowAny
 from django.contrib.auth.models import User
 from rest_framework.generics import ListAPIView
-from django.db.models import Sum
+from django.db import connection, transaction
+from datetime import timedelta
+from itertools import chain
+from django.db.models import Case, F, Sum, Value, When
+from django.utils import timezone
+from rest_framework.renderers import BrowsableAPIRenderer
+from .renderers import FastJSONRenderer, stream_json
+from .lean import (
+    decimal_to_string, file_to_url, iter_archived_orders, iter_orders, iter_products, serialize_archived_orders,
+    serialize_orders, serialize_products,
+)
+from . import analytics, currency, guest_cart, product_cache, recommendations
+
+def if_match_version(request):
+    # Version sent as If-Match: "<version>" (a weak W/ tag is accepted too).
+    # None when there is no precondition ("*" included); 0 for a tag that is
+    # not one of our versions (malformed, or out of the column's range), which
+    # never matches since versions start at 1.
+    tag = request.META.get('HTTP_IF_MATCH', '').strip()
+    if not tag or tag == '*':
+        return None
+    tag = tag[2:] if tag.startswith('W/') else tag
+    try:
+        version = int(tag.strip('"'))
+    except ValueError:
+        return 0
+    # SQLite reports no limit for the column; its driver's is 64 bits
+    highest = connection.ops.integer_field_range('PositiveIntegerField')[1] or MAX_BIGINT
+    return version if 1 <= version <= highest else 0
+
+def with_etag(response, version):
+    response['ETag'] = f'"{version}"'
+    return response
+
+PRECONDITION_FAILED = {"detail": "The resource was changed by someone else. Reload it and try again."}
+
+MAX_BIGINT = 2 ** 63 - 1  # ids beyond this overflow the database driver
+
+class LoginView(TokenObtainPairView):
+    # TokenObtainPairView that also folds the caller's guest cart (X-Guest-Cart
+    # header or "guest_cart" field) into their cart.
+    def get_serializer(self, *args, **kwargs):
+        self.serializer = super().get_serializer(*args, **kwargs)
+        return self.serializer
+
+    def post(self, request, *args, **kwargs):
+        response = super().post(request, *args, **kwargs)
+        key = guest_cart.key_from_request(request)
+        if key is not None:
+            guest_cart.merge_into_cart(self.serializer.user, key)
+        return response
 
 class UserProfileView(APIView): #Tested
     permission_classes = [IsAuthenticated]
@@ -47,21 +98,29 @@ class RegisterView(APIView):#Tested
 #     pagination_class = PageNumberPagination
 #     page_size = 10
 class ProductListView(APIView):
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
     def get(self, request, format=None):
         # Retrieve all active products
         active_products = Product.objects.filter(is_active=True)
+        in_currency = currency.from_request(request)
+
+        # Plain JSON clients get the list streamed row by row
+        if request.accepted_renderer.format == 'json':
+            rows = iter_products(active_products, currency=in_currency)
+            return currency.tag(StreamingHttpResponse(stream_json(rows), content_type='application/json'), in_currency)
 
-        # Serialize the active products
-        serializer = ProductSerializer(active_products, many=True)
+        # Serialize the active products (same output as ProductSerializer)
+        data = serialize_products(active_products, currency=in_currency)
 
         # Return the serialized data
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return currency.tag(Response(data, status=status.HTTP_200_OK), in_currency)
 class ProductDetailView(APIView):#Tested
     def get(self, request, pk):   
         product = get_object_or_404(Product, pk=pk)
+        in_currency = currency.from_request(request)
 
-        serializer = ProductSerializer(product)
-        return Response(serializer.data)
+        serializer = ProductSerializer(product, context={'currency': in_currency})
+        return currency.tag(with_etag(Response(serializer.data), product.version), in_currency)
 
     def handle_exception(self, exc):
         if isinstance(exc, Http404):
@@ -69,6 +128,51 @@ class ProductDetailView(APIView):#Tested
 
         return super().handle_exception(exc)
 
+class ProductBatchView(APIView):
+    max_ids = 300
+
+    def get(self, request):
+        # ?ids=3,1,2 -> those products with their primary image, in the order
+        # asked for, and the ids that do not exist.
+        try:
+            ids = [int(pk) for value in request.query_params.getlist('ids') for pk in value.split(',') if pk.strip()]
+        except ValueError:
+            return Response({"detail": "ids must be a comma-separated list of integers."}, status=status.HTTP_400_BAD_REQUEST)
+        ids = list(dict.fromkeys(ids))
+        if not ids or len(ids) > self.max_ids:
+            return Response({"detail": f"Send between 1 and {self.max_ids} ids."}, status=status.HTTP_400_BAD_REQUEST)
+        if any(abs(pk) > MAX_BIGINT for pk in ids):
+            return Response({"detail": "ids must be 64-bit integers."}, status=status.HTTP_400_BAD_REQUEST)
+        in_currency = currency.from_request(request)
+        found = product_cache.get_many(ids)
+        to_url = file_to_url(request)
+        results = []
+        for pk in ids:
+            if pk in found:
+                item = {**found[pk], 'image': to_url(found[pk]['image'])}
+                if in_currency:
+                    item['price'] = in_currency.to_string(item['price'])
+                results.append(item)
+        missing = [pk for pk in ids if pk not in found]
+        return currency.tag(Response({'results': results, 'missing': missing}), in_currency)
+
+class RelatedProductsView(APIView):
+    price_to_string = staticmethod(decimal_to_string(Product, 'price'))
+
+    def get(self, request, pk):
+        in_currency = currency.from_request(request)
+        to_string = in_currency.to_string if in_currency else self.price_to_string
+        rows, source = recommendations.related(pk), 'co-purchase'
+        if not rows:
+            if not Product.objects.filter(pk=pk).exists():
+                return Response({"detail": "Product not found."}, status=status.HTTP_404_NOT_FOUND)
+            rows, source = recommendations.fallback(pk)
+        results = [
+            {'id': product_id, 'name': name, 'price': to_string(price), 'score': score}
+            for product_id, name, price, score in rows
+        ]
+        return currency.tag(Response({'product_id': pk, 'source': source, 'results': results}), in_currency)
+
 class AddProductView(APIView):#Tested
     permission_classes = [IsAuthenticated]
     def post(self, request):
@@ -86,10 +190,24 @@ class EditProductView(APIView):#Tested
         except Product.DoesNotExist:
             return Response({"detail": "Product not found."}, status=status.HTTP_404_NOT_FOUND)
         serializer = ProductSerializer(product, data=request.data, partial=True)
-        if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        # Only the submitted columns are written, and only if nobody else wrote
+        # the row since it was read (or since the client's If-Match version).
+        tag = if_match_version(request)
+        expected = product.version if tag is None else tag
+        changes = serializer.validated_data
+        updated = Product.objects.filter(pk=product.pk, version=expected).update(**changes, version=F('version') + 1)
+        if not updated:
+            return Response(PRECONDITION_FAILED, status=status.HTTP_412_PRECONDITION_FAILED)
+        product_cache.invalidate()
+        if expected == product.version:
+            for field, value in changes.items():
+                setattr(product, field, value)
+            product.version = expected + 1
+        else:
+            product.refresh_from_db()  # written by someone else since we read it
+        return with_etag(Response(ProductSerializer(product).data), product.version)
 
 class DeleteProductView(APIView):#Tested
     permission_classes = [IsAuthenticated]
@@ -104,15 +222,53 @@ class DeleteProductView(APIView):#Tested
 class ToggleProductListingView(APIView):#Tested
     permission_classes = [IsAuthenticated]
     def patch(self, request, product_id):
+        # A single UPDATE ... SET is_listed = NOT is_listed, so two concurrent
+        # toggles flip the flag twice instead of both writing the same value.
+        products = Product.objects.filter(id=product_id)
+        expected = if_match_version(request)
+        if expected is not None:
+            products = products.filter(version=expected)
+        updated = products.update(
+            is_listed=Case(When(is_listed=True, then=Value(False)), default=Value(True)),
+            version=F('version') + 1,
+        )
         try:
             product = Product.objects.get(id=product_id)
         except Product.DoesNotExist:
             return Response({"detail": "Product not found."}, status=status.HTTP_404_NOT_FOUND)
-        product.is_listed = not product.is_listed 
-        product.save()
+        if not updated:
+            return Response(PRECONDITION_FAILED, status=status.HTTP_412_PRECONDITION_FAILED)
+        product_cache.invalidate()
         serializer = ProductSerializer(product)
-        return Response(serializer.data)
+        return with_etag(Response(serializer.data), product.version)
     
+class BulkProductView(APIView):
+    permission_classes = [IsAuthenticated]
+    lookups = {
+        'name': 'name__icontains', 'is_active': 'is_active', 'is_listed': 'is_listed',
+        'min_price': 'price__gte', 'max_price': 'price__lte',
+    }
+
+    def post(self, request):
+        if not request.user.userprofile.is_super_user:
+            return Response({"detail": "You do not have permission to access this resource."}, status=status.HTTP_403_FORBIDDEN)
+        serializer = BulkProductSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        if 'ids' in data:
+            products = Product.objects.filter(pk__in=data['ids'])
+        else:
+            products = Product.objects.filter(**{self.lookups[key]: value for key, value in data['filter'].items()})
+        try:
+            ids, carts = products.bulk_patch(
+                price_percent=data.get('price_percent'), is_listed=data.get('is_listed'), quantity_delta=data.get('quantity_delta'),
+            )
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        product_cache.invalidate()
+        return Response({"products_updated": len(ids), "carts_updated": carts})
+
 class ProductSingleImageView(APIView):
     def get(self, request, product_id):
         try:
@@ -139,13 +295,15 @@ class ProductAllImagesView(APIView):
 class CartDetailView(APIView):
     permission_classes = [IsAuthenticated]
     def get(self, request):
+        in_currency = currency.from_request(request)
+        convert = in_currency.convert if in_currency else (lambda amount: amount)
         try:
             cart = Cart.objects.get(user=request.user)
-            cart_items = CartItem.objects.filter(cart=cart)
+            cart_items = CartItem.objects.filter(cart=cart).select_related('product')
             total_count = cart_items.aggregate(total_count=Sum('quantity'))['total_count'] or 0
             cart_data = {
                 'user': request.user.id,
-                'total_price': cart.total_price,
+                'total_price': convert(cart.total_price),
                 'total_count': total_count,
                 'products': []
             }
@@ -153,12 +311,12 @@ class CartDetailView(APIView):
                 product_data = {
                     'product_id': cart_item.product.id,
                     'name': cart_item.product.name,
-                    'price': cart_item.product.price,
+                    'price': convert(cart_item.product.price),
                     'quantity': cart_item.quantity,
-                    'subtotal': cart_item.product.price * cart_item.quantity
+                    'subtotal': convert(cart_item.product.price * cart_item.quantity)
                 }
                 cart_data['products'].append(product_data)
-            return Response(cart_data)
+            return currency.tag(Response(cart_data), in_currency)
         except Cart.DoesNotExist:
             return Response({"detail": "Cart not found for the current user."}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
@@ -170,9 +328,11 @@ class AddToCartView(APIView):
     def post(self, request, product_id):
         user = request.user
         product = Product.objects.get(pk=product_id)
+        # Safe under concurrency: the unique constraint on Cart.user makes
+        # get_or_create fall back to a get, and the item is upserted.
         cart, created = Cart.objects.get_or_create(user=user)
-        cart_item, created = CartItem.objects.get_or_create(cart=cart, product=product)
-        cart_item.save()
+        CartItem.objects.upsert(cart.id, product.id, increment=False)
+        cart.refresh_total()
         serializer = CartSerializer(cart)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     
@@ -181,17 +341,15 @@ class UpdateCartItemView(APIView):
     def post(self, request, product_id, action):
         cart = Cart.objects.get(user=request.user)
         product = Product.objects.get(pk=product_id)
-        cart_item, created = CartItem.objects.get_or_create(cart=cart, product=product)
         if action == 'add':
-            cart_item.quantity += 1
+            CartItem.objects.upsert(cart.id, product.id)
         elif action == 'minus':
-            if cart_item.quantity > 1:
-                cart_item.quantity -= 1
-            else:
-                cart_item.delete()
+            cart_items = CartItem.objects.filter(cart=cart, product=product)
+            if not cart_items.filter(quantity__gt=1).update(quantity=F('quantity') - 1):
+                cart_items.filter(quantity__lte=1).delete()
         else:
             return Response({"detail": "Invalid action. Use 'add' or 'minus'."}, status=status.HTTP_400_BAD_REQUEST)
-        cart_item.save()
+        cart.refresh_total()
         serializer = CartSerializer(cart)
         return Response(serializer.data)
 
@@ -199,39 +357,99 @@ class RemoveCartItemView(APIView):
     permission_classes = [IsAuthenticated]
     def delete(self, request, product_id):
         cart = Cart.objects.get(user=request.user)
-        product = Product.objects.get(pk=product_id)
-        if product in cart.products.all():
-            cart.products.remove(product)
-            cart.save()
+        deleted, _ = CartItem.objects.filter(cart=cart, product_id=product_id).delete()
+        if deleted:
+            cart.refresh_total()
             serializer = CartSerializer(cart)
             return Response(serializer.data)
         return Response({"detail": "Product not found in the cart."}, status=status.HTTP_400_BAD_REQUEST)
 
+class GuestCartDetailView(APIView):
+    permission_classes = [AllowAny]
+    def get(self, request):
+        key = guest_cart.key_from_request(request)
+        if key is None:
+            return Response({"detail": "Guest cart not found."}, status=status.HTTP_404_NOT_FOUND)
+        in_currency = currency.from_request(request)
+        items, _ = guest_cart.load(key)
+        return currency.tag(Response(guest_cart.detail(key, items, in_currency)), in_currency)
+
+class GuestAddToCartView(APIView):
+    permission_classes = [AllowAny]
+    def post(self, request, product_id):
+        if not Product.objects.filter(pk=product_id).exists():
+            return Response({"detail": "Product not found."}, status=status.HTTP_404_NOT_FOUND)
+        key = guest_cart.key_from_request(request)
+        if key is None:
+            key, token = guest_cart.new_token()
+        items = guest_cart.change(key, lambda items: items.setdefault(product_id, 1))
+        return Response(guest_cart.detail(key, items), status=status.HTTP_201_CREATED)
+
+class GuestUpdateCartItemView(APIView):
+    permission_classes = [AllowAny]
+    def post(self, request, product_id, action):
+        key = guest_cart.key_from_request(request)
+        if key is None:
+            return Response({"detail": "Guest cart not found."}, status=status.HTTP_404_NOT_FOUND)
+        if action == 'add':
+            if not Product.objects.filter(pk=product_id).exists():
+                return Response({"detail": "Product not found."}, status=status.HTTP_404_NOT_FOUND)
+        elif action != 'minus':
+            return Response({"detail": "Invalid action. Use 'add' or 'minus'."}, status=status.HTTP_400_BAD_REQUEST)
+
+        def apply(items):
+            if action == 'add':
+                items[product_id] = items.get(product_id, 0) + 1
+            elif items.get(product_id, 0) > 1:
+                items[product_id] -= 1
+            else:
+                items.pop(product_id, None)
+
+        items = guest_cart.change(key, apply)
+        return Response(guest_cart.detail(key, items))
+
+class GuestRemoveCartItemView(APIView):
+    permission_classes = [AllowAny]
+    def delete(self, request, product_id):
+        key = guest_cart.key_from_request(request)
+        if key is None:
+            return Response({"detail": "Guest cart not found."}, status=status.HTTP_404_NOT_FOUND)
+        items = guest_cart.change(key, lambda items: items.pop(product_id, None) is not None)
+        if items is None:
+            return Response({"detail": "Product not found in the cart."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(guest_cart.detail(key, items))
+
 class GetAddressView(APIView):
     permission_classes = [IsAuthenticated]
     def get(self, request):
-        user_profile = UserProfile.objects.get(user=request.user)
-        latest_address = Address.objects.filter(user_profile=user_profile).order_by('-id').first()
-        if latest_address:
-            serializer = AddressSerializer(latest_address)
+        default_address = Address.objects.filter(user_profile__user=request.user, is_default=True).first()
+        if default_address:
+            serializer = AddressSerializer(default_address)
             return Response(serializer.data)
         else:
             return Response({"detail": "No address found for the user."}, status=status.HTTP_404_NOT_FOUND)
 
 
+class AddressListView(APIView):
+    permission_classes = [IsAuthenticated]
+    def get(self, request):
+        addresses = Address.objects.filter(user_profile__user=request.user).order_by('-is_default', '-id')
+        serializer = AddressSerializer(addresses, many=True)
+        return Response(serializer.data)
+
+
 class AddAddressView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        print("REached")
-        user_profile = UserProfile.objects.get(user=request.user)
-        request.data['user_profile'] = user_profile.id
         serializer = AddressSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.validated_data['user_profile'] = user_profile
-            address = Address.objects.create(**serializer.validated_data)
-            serialized_address = AddressSerializer(address)
-            return Response(serialized_address.data, status=status.HTTP_201_CREATED)
+            user_profile_id = UserProfile.objects.values_list('id', flat=True).get(user=request.user)
+            # A new address becomes the default one
+            with transaction.atomic():
+                Address.objects.filter(user_profile_id=user_profile_id, is_default=True).update(is_default=False)
+                serializer.save(user_profile_id=user_profile_id, is_default=True)
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
@@ -239,27 +457,57 @@ class EditAddressView(APIView):
     permission_classes = [IsAuthenticated]
     def put(self, request, address_id):
         try:
-            address = Address.objects.get(id=address_id)
+            address = Address.objects.get(id=address_id, user_profile__user=request.user)
         except Address.DoesNotExist:
             return Response({"detail": "Address not found."}, status=status.HTTP_404_NOT_FOUND)
-        if request.user != address.user_profile.user:
-            return Response({"detail": "You do not have permission to edit this address."}, status=status.HTTP_403_FORBIDDEN)
         serializer = AddressSerializer(address, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+
+class SetDefaultAddressView(APIView):
+    permission_classes = [IsAuthenticated]
+    def post(self, request, address_id):
+        addresses = Address.objects.filter(user_profile__user=request.user)
+        with transaction.atomic():
+            # Clear first: the partial unique index allows one default per profile
+            addresses.filter(is_default=True).exclude(id=address_id).update(is_default=False)
+            if not addresses.filter(id=address_id).update(is_default=True):
+                transaction.set_rollback(True)
+                return Response({"detail": "Address not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"detail": "Default address updated."})
+
+
+class DeleteAddressView(APIView):
+    permission_classes = [IsAuthenticated]
+    def delete(self, request, address_id):
+        addresses = Address.objects.filter(user_profile__user=request.user)
+        with transaction.atomic():
+            address = addresses.filter(id=address_id).only('id', 'is_default').first()
+            if address is None:
+                return Response({"detail": "Address not found."}, status=status.HTTP_404_NOT_FOUND)
+            address.delete()
+            # The newest remaining address takes over as default
+            if address.is_default:
+                latest = addresses.order_by('-id').values_list('id', flat=True).first()
+                if latest is not None:
+                    Address.objects.filter(id=latest).update(is_default=True)
+        return Response({"detail": "Address deleted successfully."}, status=status.HTTP_204_NO_CONTENT)
+
 class BuyNowView(APIView):
     permission_classes = [IsAuthenticated]
     def post(self, request, product_id):
         user = request.user
         product = Product.objects.get(pk=product_id)
-        order = Order.objects.create(
-            user=user,
-            total_price=product.price,
-        )
-        order.products.add(product)
+        # One transaction, so nobody sees the order without its products
+        with transaction.atomic():
+            order = Order.objects.create(
+                user=user,
+                total_price=product.price,
+            )
+            order.products.add(product)
         serializer = OrderSerializer(order)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
@@ -274,26 +522,55 @@ class CartCheckoutView(APIView):
         except Cart.DoesNotExist:
             return Response({"detail": "Empty cart. No items to checkout."}, status=status.HTTP_400_BAD_REQUEST)
 
-        order = Order.objects.create(
-            user=user,
-            total_price=cart.total_price,
-        )
+        # One transaction, so nobody sees the order without its products
+        with transaction.atomic():
+            order = Order.objects.create(
+                user=user,
+                total_price=cart.total_price,
+            )
 
-        for cart_item in cart_items:
-            order.products.add(cart_item.product)
+            order.products.add(*[cart_item.product_id for cart_item in cart_items])
 
-        cart_items.delete()
-        cart.delete()
+            cart_items.delete()
+            cart.delete()
 
         serializer = OrderSerializer(order)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     
 class OrderView(APIView):
     permission_classes = [IsAuthenticated]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
     def get(self, request):
         orders = Order.objects.filter(user=request.user)
-        serializer = OrderSerializer(orders, many=True)
-        return Response(serializer.data)
+        in_currency = currency.from_request(request)
+        if 'limit' in request.query_params:
+            return currency.tag(self.page(request, orders, in_currency), in_currency)
+        # Live orders first, then the ones moved to the archive
+        archived = ArchivedOrder.objects.filter(user=request.user).order_by('id')
+        if request.accepted_renderer.format == 'json':
+            rows = chain(iter_orders(orders, currency=in_currency), iter_archived_orders(archived, currency=in_currency))
+            return currency.tag(StreamingHttpResponse(stream_json(rows), content_type='application/json'), in_currency)
+        data = serialize_orders(orders, in_currency) + serialize_archived_orders(archived, in_currency)
+        return currency.tag(Response(data), in_currency)
+
+    def page(self, request, orders, in_currency=None):
+        # Newest first, ?limit=N&before=<order id>. Archived orders keep their
+        # ids, so paging runs on past the live history into the archive.
+        try:
+            limit = min(max(int(request.query_params['limit']), 1), 100)
+            before = min(max(int(request.query_params.get('before', 0)), 0), MAX_BIGINT)
+        except ValueError:
+            return Response({"detail": "limit and before must be integers."}, status=status.HTTP_400_BAD_REQUEST)
+        archived = ArchivedOrder.objects.filter(user=request.user)
+        if before:
+            orders = orders.filter(id__lt=before)
+            archived = archived.filter(id__lt=before)
+        data = (
+            serialize_orders(orders.order_by('-id')[:limit], in_currency)
+            + serialize_archived_orders(archived.order_by('-id')[:limit], in_currency)
+        )
+        data.sort(key=lambda order: order['id'], reverse=True)
+        return Response(data[:limit])
     
 class AdminOrderView(APIView):
     permission_classes = [IsAuthenticated]
@@ -303,11 +580,54 @@ class AdminOrderView(APIView):
         if request.user.userprofile.is_super_user:
             admin_orders = AdminOrder.objects.all().order_by('-id')  
             paginator = self.pagination_class()
+            paginator.page_size = self.page_size
             result_page = paginator.paginate_queryset(admin_orders, request)
             serializer = AdminOrderSerializer(result_page, many=True)
             return paginator.get_paginated_response(serializer.data)
         return Response({"detail": "You do not have permission to access this resource."}, status=status.HTTP_403_FORBIDDEN)
     
+def analytics_since(request):
+    # ?days=N, 1 to 3650 (larger values would overflow the date arithmetic)
+    try:
+        days = min(max(int(request.query_params.get('days', 30)), 1), 3650)
+    except ValueError:
+        days = 30
+    return timezone.localdate() - timedelta(days=days - 1)
+
+class AdminTopProductsView(APIView):
+    permission_classes = [IsAuthenticated]
+    def get(self, request):
+        if not request.user.userprofile.is_super_user:
+            return Response({"detail": "You do not have permission to access this resource."}, status=status.HTTP_403_FORBIDDEN)
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), 100)
+        except ValueError:
+            limit = 10
+        order_by = '-revenue' if request.query_params.get('by') == 'revenue' else '-units'
+        top = (
+            DailyProductSales.objects.filter(day__gte=analytics_since(request))
+            .values('product', 'product__name')
+            .annotate(units=Sum('units'), revenue=Sum('revenue'))
+            .order_by(order_by, 'product')[:limit]
+        )
+        data = [
+            {'product_id': row['product'], 'name': row['product__name'], 'units': row['units'], 'revenue': row['revenue']}
+            for row in top
+        ]
+        return Response(data)
+
+class AdminSalesSeriesView(APIView):
+    permission_classes = [IsAuthenticated]
+    def get(self, request):
+        if not request.user.userprofile.is_super_user:
+            return Response({"detail": "You do not have permission to access this resource."}, status=status.HTTP_403_FORBIDDEN)
+        rows = DailyStatusSales.objects.filter(day__gte=analytics_since(request))
+        order_status = request.query_params.get('status')
+        if order_status:
+            rows = rows.filter(status=order_status)
+        series = rows.values('day').annotate(orders=Sum('orders'), revenue=Sum('revenue')).order_by('day')
+        return Response(list(series))
+
 class ChangeOrderStatusView(APIView):
     permission_classes = [IsAuthenticated]
     def put(self, request, order_id):
@@ -322,10 +642,22 @@ class ChangeOrderStatusView(APIView):
             return Response({"detail": "Status must be provided in the request data."}, status=status.HTTP_400_BAD_REQUEST)
         if new_status not in dict(Order.STATUS_CHOICES).keys():
             return Response({"detail": "Invalid status provided."}, status=status.HTTP_400_BAD_REQUEST)
-        order.status = new_status
-        order.save()
+        tag = if_match_version(request)
+        expected = order.version if tag is None else tag
+        with transaction.atomic():
+            # The rollups need the row being replaced, which is not the one
+            # read above when If-Match names a newer version, so it is read
+            # again (and locked) at the expected version.
+            current = Order.objects.select_for_update().filter(pk=order.pk, version=expected)
+            before = current.values_list('status', 'total_price', 'created_at').first()
+            if before is None or not current.update(status=new_status, version=F('version') + 1):
+                return Response(PRECONDITION_FAILED, status=status.HTTP_412_PRECONDITION_FAILED)
+            order.status, order.total_price, order.created_at = new_status, before[1], before[2]
+            order.version = expected + 1
+            # update() sends no signals, so the rollups are told directly
+            analytics.record_order(order, before=before)
         serializer = OrderSerializer(order)
-        return Response(serializer.data)
+        return with_etag(Response(serializer.data), order.version)
     
 class DeleteOrderView(APIView):
     permission_classes = [IsAuthenticated]
@@ -343,6 +675,7 @@ class CreateOrderView(APIView):
     def post(self, request):
         serializer = OrderSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save(user=request.user) 
+            with transaction.atomic():  # the order and its products together
+                serializer.save(user=request.user)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
@@ -0,0 +1,82 @@
+# warmup.py
+#
+# Pays the one-off costs of a fresh worker before it takes traffic: URL
+# pattern compilation, DRF / simplejwt imports and settings, serializer field
+# introspection and, in the worker itself, the database connection and the
+# ContentType cache. ecom/wsgi.py runs it at import (also under gunicorn
+# --preload); gunicorn.conf.py runs it again with connect=True once each
+# worker is up. /readyz reports ready once it has completed.
+
+import time
+
+ready = False
+
+
+def _compile_patterns(patterns):
+    from django.urls import URLResolver
+
+    for pattern in patterns:
+        pattern.pattern.regex  # compiled lazily on first access
+        if isinstance(pattern, URLResolver):
+            _compile_patterns(pattern.url_patterns)
+
+
+def warm_up(connect=True):
+    # Returns {step: seconds}. connect=False skips everything that opens a
+    # database connection, which must not happen in a pre-fork master.
+    global ready
+    timings = {}
+
+    def step(name, func):
+        start = time.perf_counter()
+        func()
+        timings[name] = time.perf_counter() - start
+
+    def urls():
+        from django.urls import get_resolver
+
+        resolver = get_resolver()
+        _compile_patterns(resolver.url_patterns)
+        resolver.reverse_dict  # populates the reverse/namespace lookups
+
+    def drf():
+        from rest_framework.views import APIView
+        from rest_framework_simplejwt.authentication import JWTAuthentication
+        from rest_framework_simplejwt.state import token_backend  # noqa: F401
+
+        JWTAuthentication()
+        view = APIView()
+        view.get_renderers(), view.get_parsers(), view.get_content_negotiator()
+
+    def serializers():
+        from rest_framework.serializers import ModelSerializer
+
+        from api import serializers as api_serializers
+
+        for value in vars(api_serializers).values():
+            if isinstance(value, type) and issubclass(value, ModelSerializer) and value is not ModelSerializer:
+                value().fields
+
+    def database():
+        from django.contrib.contenttypes.models import ContentType
+        from django.db import connections
+
+        for connection in connections.all():
+            connection.ensure_connection()
+        # Read only: get_for_models() would insert the rows it does not find
+        manager = ContentType.objects
+        for content_type in manager.filter(app_label='api'):
+            manager._add_to_cache(manager.db, content_type)
+
+    step('urls', urls)
+    step('drf', drf)
+    step('serializers', serializers)
+    if connect:
+        step('database', database)
+    ready = True
+    return timings
+
+
+def mark_ready():
+    global ready
+    ready = True
@@ -45,7 +45,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.middleware.HealthCheckMiddleware",
+    "api.middleware.ProfilingMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "api.middleware.CompressionMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     'corsheaders.middleware.CorsMiddleware',
     "django.middleware.common.CommonMiddleware",
@@ -83,6 +86,9 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # Keep connections across requests (opened by api/warmup.py at worker start)
+        "CONN_MAX_AGE": 60,
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 
@@ -123,6 +129,30 @@ USE_TZ = True
 
 STATIC_URL = "static/"
 
+# Response compression (api.middleware.CompressionMiddleware)
+# Buffered responses smaller than COMPRESSION_MIN_SIZE bytes are sent as is.
+# Only the content types below are compressed; brotli is used when installed
+# and accepted by the client, gzip otherwise.
+
+COMPRESSION_MIN_SIZE = 1024
+
+COMPRESSION_LEVELS = {
+    "application/json": {"br": 5, "gzip": 6},
+    "text/html": {"br": 5, "gzip": 6},
+    "text/plain": {"br": 4, "gzip": 6},
+}
+
+# Request profiling (api.middleware.ProfilingMiddleware). Requests with a
+# signed X-Profile header (manage.py profile_token) are always profiled, others
+# with probability PROFILE_SAMPLE_RATE. Stacks are sampled every
+# PROFILE_INTERVAL seconds; only the newest PROFILE_MAX_FILES profiles are kept.
+
+PROFILE_SAMPLE_RATE = 0.0
+PROFILE_INTERVAL = 0.005
+PROFILE_DIR = BASE_DIR / "profiles"
+PROFILE_MAX_FILES = 500
+PROFILE_TOKEN_MAX_AGE = 60 * 60
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -138,3 +168,26 @@ REST_FRAMEWORK = {
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",  # Add your frontend domain
 ]
+
+from corsheaders.defaults import default_headers
+
+CORS_ALLOW_HEADERS = (*default_headers, "x-guest-cart", "accept-currency")
+
+# Guest carts (api/guest_cart.py) live this many seconds after their last change
+GUEST_CART_TTL = 60 * 60 * 24 * 14
+
+# Product entries served by /api/products/batch/ (api/product_cache.py) are
+# kept in each process and dropped on every product write; a process also
+# starts over once it holds more than this many
+PRODUCT_CACHE_SIZE = 20000
+
+# Retention (manage.py apply_retention): delivered orders older than this many
+# days move to the archive, carts idle this long are deleted
+ORDER_ARCHIVE_DAYS = 365
+ABANDONED_CART_DAYS = 30
+
+# Prices are stored in BASE_CURRENCY; other currencies come from CurrencyRate
+# (api/currency.py). manage.py load_currency_rates reads CURRENCY_RATES_FILE
+# unless given another path.
+BASE_CURRENCY = "INR"
+CURRENCY_RATES_FILE = BASE_DIR / "currency_rates.json"
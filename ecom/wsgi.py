@@ -14,3 +14,13 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ecom.settings")
 
 application = get_wsgi_application()
+
+# Pay URL, DRF and serializer setup costs now instead of on the first request.
+# No database work here: under gunicorn --preload this runs before the fork.
+# Set DJANGO_WARMUP=0 to skip.
+from api import warmup  # noqa: E402
+
+if os.environ.get("DJANGO_WARMUP", "1") != "0":
+    warmup.warm_up(connect=False)
+else:
+    warmup.mark_ready()
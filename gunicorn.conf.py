@@ -0,0 +1,16 @@
+# gunicorn -c gunicorn.conf.py ecom.wsgi
+#
+# The app is imported (and warmed up, see api/warmup.py) once in the master;
+# each worker then opens its database connection and primes its caches before
+# it accepts requests.
+
+import os
+
+preload_app = True
+
+
+def post_worker_init(worker):
+    if os.environ.get("DJANGO_WARMUP", "1") != "0":
+        from api.warmup import warm_up
+
+        warm_up(connect=True)